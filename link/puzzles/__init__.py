@@ -0,0 +1,41 @@
+from typing import Callable, Dict, List, Union
+import importlib
+
+# puzzle name -> the function that evaluates models on it (called by link/test.py with the same keyword arguments
+# as escaperoom's play()), or a "module:function" string imported when the puzzle is first run, so listing puzzles
+# does not import them. Packages can add puzzles through the entry point group.
+ENTRY_POINT_GROUP = "link.puzzles"
+_puzzles: Dict[str, Union[Callable, str]] = {
+    "escaperoom": "link.puzzles.escaperoom.play:play",
+}
+_entry_points_loaded = False
+
+
+def register_puzzle(name: str, run: Union[Callable, str]):
+    _puzzles[name] = run
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if not _entry_points_loaded:
+        _entry_points_loaded = True
+        import importlib.metadata
+        for entry_point in importlib.metadata.entry_points(group=ENTRY_POINT_GROUP):
+            _puzzles.setdefault(entry_point.name, entry_point.value)
+
+
+def list_puzzles() -> List[str]:
+    _load_entry_points()
+    return list(_puzzles)
+
+
+def get_puzzle(name: str) -> Callable:
+    if name not in _puzzles:
+        _load_entry_points()
+    if name not in _puzzles:
+        raise ValueError(f"Puzzle {name} does not exist. Choose from {list(_puzzles)}")
+    run = _puzzles[name]
+    if isinstance(run, str):
+        module, _, attribute = run.partition(":")
+        run = _puzzles[name] = getattr(importlib.import_module(module), attribute)
+    return run
@@ -1,6 +1,30 @@
 #
+import importlib
+import sys
+import types
+
 from .entities import GridPuzzle, Door, Button, Rock
-from .runner import Runner 
-from .play import play
 from .levels import *  
-from .actions import ActionHandler
\ No newline at end of file
+from .actions import ActionHandler
+
+# Runner and play() bring in the runner's clients, caches and result sinks, so they are imported on first use
+_LAZY = {"Runner": ".runner", "play": ".play"}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # importing the play submodule binds it to the package's play attribute; keep the play() function there
+        if name in _LAZY and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
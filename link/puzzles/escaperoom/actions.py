@@ -1,7 +1,10 @@
 from enum import Enum 
-from dataclasses import dataclass
-from typing import Dict, Callable, Optional, Any
-from link.puzzles.escaperoom.entities import GridPuzzle 
+from dataclasses import dataclass, field
+from functools import partial
+from types import MappingProxyType
+from typing import Dict, Callable, Iterable, List, Mapping, Optional, Any, Union
+import threading
+from link.puzzles.escaperoom.entities import GridPuzzle, Door, Button, Rock
 
 class ActionType(Enum):
     MOVE = "move"
@@ -14,13 +17,41 @@ class Direction(Enum):
     LEFT = "left"
     RIGHT = "right"
         
-@dataclass
+# parsed actions are interned: every distinct action is one shared Action whose code indexes _actions
+_actions: List['Action'] = []
+_actions_by_name: Dict[str, 'Action'] = {}
+# raw strings (as sent by the model) -> parsed action, or None if the string is not an action
+_parsed: Dict[str, Optional['Action']] = {}
+_intern_lock = threading.Lock()
+# model output is arbitrary text, so both tables stop growing past these sizes
+MAX_INTERNED_ACTIONS = 1024
+MAX_PARSED_STRINGS = 4096
+
+@dataclass(frozen=True, slots=True)
 class Action:
     type: ActionType
-    params: Dict[str, Any]
+    # read-only for actions from parse()/intern_action, which every caller of the same string shares
+    params: Mapping[str, Any]
+    # position in the interned action table, -1 if the action was not interned; not part of equality, so an
+    # interned action equals the same action built by hand
+    code: int = field(default=-1, compare=False)
     
     @classmethod
     def parse(cls, action_str: str) -> Optional['Action']:
+        # the same strings come back turn after turn, so each is only parsed once
+        try:
+            return _parsed[action_str]
+        except KeyError:
+            pass
+        action = cls._parse(action_str)
+        if action is not None:
+            action = intern_action(action.type, action.params)
+        if len(_parsed) < MAX_PARSED_STRINGS:
+            _parsed[action_str] = action
+        return action
+
+    @classmethod
+    def _parse(cls, action_str: str) -> Optional['Action']:
         try:
             parts = action_str.lower().strip().split()
             if not parts:
@@ -43,6 +74,12 @@ class Action:
         
         return None
 
+    def __reduce__(self):
+        # mapping proxies cannot be pickled: rebuild from a plain dict, interned again if this action was
+        if self.code >= 0:
+            return intern_action, (self.type, dict(self.params))
+        return self.__class__, (self.type, dict(self.params))
+
     def __str__(self) -> str:
         if self.type == ActionType.MOVE:
             return f"move {self.params['direction'].value}"
@@ -51,6 +88,46 @@ class Action:
         return "invalid action"
 
 
+def intern_action(action_type: ActionType, params: Dict[str, Any]) -> Action:
+    name = str(Action(action_type, params))
+    action = _actions_by_name.get(name)
+    if action is not None:
+        return action
+    with _intern_lock:
+        action = _actions_by_name.get(name)
+        if action is None:
+            if len(_actions) >= MAX_INTERNED_ACTIONS:
+                return Action(action_type, MappingProxyType(dict(params)))
+            action = Action(action_type, MappingProxyType(dict(params)), len(_actions))
+            _actions.append(action)
+            _actions_by_name[name] = action
+    return action
+
+
+def get_action(code: int) -> Action:
+    return _actions[code]
+
+
+_type_names: Dict[type, str] = {}
+
+
+def get_type_name(cls: type) -> str:
+    # the name objects go by in actions, e.g. Rock -> "rock"
+    name = _type_names.get(cls)
+    if name is None:
+        name = _type_names[cls] = cls.__name__.lower()
+    return name
+
+
+# moves get codes 0-3 in Direction order, then pick_up/drop for the built-in objects
+for _direction in Direction:
+    intern_action(ActionType.MOVE, {"direction": _direction})
+for _cls in (Door, Button, Rock):
+    intern_action(ActionType.PICK_UP, {"object": get_type_name(_cls)})
+    intern_action(ActionType.DROP, {"object": get_type_name(_cls)})
+MOVE_ACTIONS = [str(get_action(code)) for code in range(len(Direction))]
+
+
 class ActionHandler: 
     def __init__(self, puzzle: GridPuzzle): 
         self.puzzle = puzzle 
@@ -62,16 +139,18 @@ class ActionHandler:
             ActionType.PICK_UP: self._handle_pick_up, 
             ActionType.DROP: self._handle_drop
         }
+        # action code -> handler with its params already bound
+        self._compiled: Dict[int, Callable[[], str]] = {}
     
-    def _handle_move(self, params: Dict[str, Any]) -> str: 
+    def _handle_move(self, params: Mapping[str, Any]) -> str: 
         direction = params['direction']
         return self.puzzle.move_player(direction.value)
 
-    def _handle_pick_up(self, params: Dict[str, Any]) -> str: 
+    def _handle_pick_up(self, params: Mapping[str, Any]) -> str: 
         object_name = params['object']
         return self.puzzle.equip(object_name)
     
-    def _handle_drop(self, params: Dict[str, Any]) -> str: 
+    def _handle_drop(self, params: Mapping[str, Any]) -> str: 
         object_name = params['object']
         return self.puzzle.drop(object_name)
     
@@ -81,26 +160,48 @@ class ActionHandler:
         if action is None: 
             return f"Invalid action format: {action_str}\n{self.get_action_help()}"
     
-        if action.type not in self.handlers:
-            return f"Unsupported action type {action.type}" 
-    
-        return self.handlers[action.type](action.params)
+        return self.execute_action(action)
+
+    def execute_action(self, action: Action) -> str:
+        call = self._compiled.get(action.code)
+        if call is None:
+            if action.type not in self.handlers:
+                return f"Unsupported action type {action.type}" 
+            call = partial(self.handlers[action.type], action.params)
+            if action.code >= 0:
+                self._compiled[action.code] = call
+        return call()
+
+    def execute_many(self, actions: Iterable[Union[str, Action]]) -> List[str]:
+        # one result per action, in order; strings are parsed like execute(). Same results as calling
+        # execute() for each, with the lookups hoisted out of the loop
+        results = []
+        append = results.append
+        parse = Action.parse
+        compiled = self._compiled
+        for action in actions:
+            if isinstance(action, str):
+                parsed = parse(action)
+                if parsed is None:
+                    append(f"Invalid action format: {action}\n{self.get_action_help()}")
+                    continue
+                action = parsed
+            call = compiled.get(action.code)
+            append(call() if call is not None else self.execute_action(action))
+        return results
     
     def get_available_actions(self) -> list[str]: # maybe just reg str 
-        current_objects = [obj.__class__.__name__.lower() for obj in self.puzzle.get_objects_at(self.puzzle.player)]
-
-        inventory_object = (self.puzzle.player.inventory.__class__.__name__.lower() if self.puzzle.player.inventory else None)
+        current_objects = [get_type_name(type(obj)) for obj in self.puzzle.get_objects_at(self.puzzle.player)]
 
-        actions = []
+        inventory = self.puzzle.player.inventory
 
-        for direction in Direction: 
-            actions.append(f"move {direction.value}")
+        actions = list(MOVE_ACTIONS)
         
         for obj in current_objects: 
             actions.append(f"pick_up {obj}")
         
-        if inventory_object: 
-            actions.append(f"drop {inventory_object}")
+        if inventory: 
+            actions.append(f"drop {get_type_name(type(inventory))}")
         
         return actions
 
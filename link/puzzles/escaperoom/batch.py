@@ -0,0 +1,173 @@
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from link.puzzles.escaperoom.actions import Action, ActionType, Direction
+from link.puzzles.escaperoom.entities import GridPuzzle, Door, PuzzleState
+
+# integer action codes; pick_up/drop codes follow, one pair per object type in the level
+NOOP = -1
+MOVES = {Direction.UP: (0, 0, 1), Direction.DOWN: (1, 0, -1), Direction.LEFT: (2, -1, 0), Direction.RIGHT: (3, 1, 0)}
+
+
+class BatchPuzzle:
+    """N copies of one GridPuzzle stepped together, with the state held in NumPy arrays.
+
+    Follows the same rules as GridPuzzle/ActionHandler, including which object in a cell gets picked up
+    (the one placed there first) and which door is the exit (the first one on the grid), so snapshot(i)
+    matches GridPuzzle.snapshot() after the same actions. Buttons may only be linked to doors.
+    """
+
+    def __init__(self, puzzle: GridPuzzle, num_episodes: int):
+        entities = puzzle._entities
+        self.template = puzzle
+        self.num_episodes = n = num_episodes
+        self.num_entities = e = len(entities)
+        self.grid_size = np.array(puzzle.grid_size)
+        self.player_weight = puzzle.player.weight
+
+        # static description of the level
+        self.type_names: List[str] = sorted({type(obj).__name__.lower() for obj in entities})
+        self.entity_types = np.array([self.type_names.index(type(obj).__name__.lower()) for obj in entities], dtype=np.int64)
+        self.entity_weights = np.array([getattr(obj, 'weight', 0) for obj in entities], dtype=np.int64)
+        self.entity_carryable = np.array([obj.carryable for obj in entities], dtype=bool)
+        self.button_ids = [entities.index(button) for button in puzzle._buttons]
+        self.door_ids = [entities.index(door) for door in puzzle._doors]
+        self.thresholds = np.array([button.weight_threshold for button in puzzle._buttons], dtype=np.int64)
+        self.links: List[List[int]] = []
+        for button in puzzle._buttons:
+            if any(not isinstance(obj, Door) for obj in button.linked_objects):
+                raise ValueError("BatchPuzzle only supports buttons linked to doors")
+            self.links.append([puzzle._doors.index(door) for door in button.linked_objects])
+        self.is_door = np.isin(np.arange(e), self.door_ids)
+
+        # per-episode state
+        self.player = np.tile(np.array(puzzle.player.position, dtype=np.int64), (n, 1))
+        inventory = entities.index(puzzle.player.inventory) if puzzle.player.inventory else -1
+        self.inventory = np.full(n, inventory, dtype=np.int64)
+        self.positions = np.tile(np.array([obj.position for obj in entities], dtype=np.int64).reshape(e, 2), (n, 1, 1))
+        self.weights = np.tile(np.array([b.current_weight for b in puzzle._buttons], dtype=np.int64), (n, 1))
+        self.pressed = np.tile(np.array([b.pressed for b in puzzle._buttons], dtype=bool), (n, 1))
+        self.door_open = np.tile(np.array([d.open for d in puzzle._doors], dtype=bool), (n, 1))
+        self.steps = np.full(n, puzzle.steps, dtype=np.int64)
+        # when each object was put in its cell: GridPuzzle keeps cell and type lists in placement order
+        order = {id(obj): i for i, obj in enumerate(puzzle.objects)}
+        self.placed = np.tile(np.array([order.get(id(obj), -1) for obj in entities], dtype=np.int64), (n, 1))
+        self._clock = len(entities)
+
+    # action codes
+    def encode(self, action_str: str) -> int:
+        action = Action.parse(action_str)
+        if action is None:
+            return NOOP
+        if action.type == ActionType.MOVE:
+            return MOVES[action.params['direction']][0]
+        if action.params['object'] not in self.type_names:
+            return NOOP
+        type_code = self.type_names.index(action.params['object'])
+        return 4 + 2 * type_code + (1 if action.type == ActionType.DROP else 0)
+
+    def encode_many(self, action_strs: Sequence[str]) -> np.ndarray:
+        return np.array([self.encode(a) for a in action_strs], dtype=np.int64)
+
+    # stepping
+    def _on_grid(self) -> np.ndarray:
+        return np.arange(self.num_entities)[None, :] != self.inventory[:, None]
+
+    def _buttons_at(self, mask: np.ndarray, position: np.ndarray, b: int) -> np.ndarray:
+        button = self.button_ids[b]
+        return mask & (self.inventory != button) & (self.positions[:, button] == position).all(axis=1)
+
+    def _add_weight(self, mask: np.ndarray, position: np.ndarray, weight: np.ndarray):
+        for b, links in enumerate(self.links):
+            here = self._buttons_at(mask, position, b)
+            self.weights[here, b] += weight[here] if weight.ndim else weight
+            press = here & ~self.pressed[:, b] & (self.weights[:, b] >= self.thresholds[b])
+            self.pressed[press, b] = True
+            for d in links:
+                self.door_open[press, d] = True
+
+    def _remove_weight(self, mask: np.ndarray, position: np.ndarray, weight: np.ndarray):
+        for b, links in enumerate(self.links):
+            here = self._buttons_at(mask, position, b)
+            self.weights[here, b] = np.maximum(0, self.weights[here, b] - (weight[here] if weight.ndim else weight))
+            unpress = here & self.pressed[:, b] & (self.weights[:, b] < self.thresholds[b])
+            self.pressed[unpress, b] = False
+            for d in links:
+                self.door_open[unpress, d] = False
+
+    def step(self, actions: np.ndarray):
+        """Applies one action code per episode (NOOP leaves an episode unchanged)."""
+        actions = np.asarray(actions, dtype=np.int64)
+        rows = np.arange(self.num_episodes)
+
+        # movement, with leave effects before enter effects like GridPuzzle.handle_player_movement
+        is_move = (actions >= 0) & (actions < 4)
+        delta = np.zeros((self.num_episodes, 2), dtype=np.int64)
+        for code, dx, dy in MOVES.values():
+            delta[actions == code] = (dx, dy)
+        target = self.player + delta
+        moved = is_move & (target >= 0).all(axis=1) & (target < self.grid_size).all(axis=1)
+        old = self.player.copy()
+        self.player[moved] = target[moved]
+        self.steps += moved
+        self._remove_weight(moved, old, np.int64(self.player_weight))
+        self._add_weight(moved, self.player, np.int64(self.player_weight))
+
+        type_code = (actions - 4) // 2
+        holding = self.inventory >= 0
+        held_type = np.where(holding, self.entity_types[np.maximum(self.inventory, 0)], -1)
+
+        # pick_up: the held object if it matches, otherwise the earliest placed match in the cell
+        pick = (actions >= 4) & ((actions - 4) % 2 == 0)
+        if pick.any():
+            in_cell = self._on_grid() & (self.positions == self.player[:, None, :]).all(axis=2)
+            matches = in_cell & (self.entity_types[None, :] == type_code[:, None])
+            first = np.where(matches, self.placed, np.iinfo(np.int64).max).argmin(axis=1)
+            candidate = np.where(matches[rows, first], first, -1)
+            obj = np.where(holding & (held_type == type_code), self.inventory, candidate)
+            # GridPuzzle.equip refuses objects that are not carryable, without any effect
+            found = pick & (obj >= 0) & self.entity_carryable[np.maximum(obj, 0)]
+            # GridPuzzle.equip takes the weight off the cell's buttons even when the hands are full
+            self._remove_weight(found, self.player, self.entity_weights[np.maximum(obj, 0)])
+            take = found & ~holding
+            self.inventory[take] = obj[take]
+
+        # drop: only the held object, onto the current cell
+        drop = (actions >= 4) & ((actions - 4) % 2 == 1) & holding & (held_type == type_code)
+        if drop.any():
+            obj = np.maximum(self.inventory, 0)
+            self._add_weight(drop, self.player, self.entity_weights[obj])
+            self.positions[drop, obj[drop]] = self.player[drop]
+            self.placed[drop, obj[drop]] = self._clock
+            self._clock += 1
+            self.inventory[drop] = -1
+
+    def is_solved(self) -> np.ndarray:
+        # the exit is the first door on the grid, as in GridPuzzle.is_solved
+        doors = self._on_grid() & self.is_door[None, :]
+        if not doors.any():
+            return np.zeros(self.num_episodes, dtype=bool)
+        exit_door = np.where(doors, self.placed, np.iinfo(np.int64).max).argmin(axis=1)
+        has_door = doors.any(axis=1)
+        door_index = np.searchsorted(self.door_ids, exit_door)
+        rows = np.arange(self.num_episodes)
+        at_door = (self.player == self.positions[rows, exit_door]).all(axis=1)
+        return has_door & self.door_open[rows, np.minimum(door_index, len(self.door_ids) - 1)] & at_door
+
+    def snapshot(self, i: int) -> PuzzleState:
+        # same bytes as GridPuzzle.snapshot() for episode i
+        values = [*self.player[i].tolist(), int(self.inventory[i])]
+        values.extend(self.positions[i].reshape(-1).tolist())
+        values.extend(self.weights[i].tolist())
+        values.extend(self.pressed[i].tolist())
+        values.extend(self.door_open[i].tolist())
+        return self.template._get_state_format().pack(*values)
+
+
+def get_action_space(batch: BatchPuzzle) -> Dict[str, int]:
+    actions = {f"move {direction.value}": code for direction, (code, _, _) in MOVES.items()}
+    for name in batch.type_names:
+        actions[f"pick_up {name}"] = batch.encode(f"pick_up {name}")
+        actions[f"drop {name}"] = batch.encode(f"drop {name}")
+    return actions
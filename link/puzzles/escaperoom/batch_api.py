@@ -0,0 +1,251 @@
+from abc import ABC, abstractmethod
+import json
+import shutil
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from link.puzzles.escaperoom.clients import LOCAL_PROVIDER, Messages
+from link.puzzles.escaperoom.metrics import get_usage
+from link.puzzles.escaperoom.runner import Runner
+from link.puzzles.escaperoom.scheduler import get_provider
+
+# requests and results use the OpenAI batch format: one JSON object per line, matched up by custom_id
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+# statuses after which a job will not change any more
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# how long to wait for one job: OpenAI's 24h completion window and an hour to spare
+DEFAULT_JOB_TIMEOUT = 25 * 3600.0
+
+
+def to_dict(obj: Any) -> Any:
+    # responses from LocalClient/HttpClient (SimpleNamespace) or provider SDKs (pydantic) as plain JSON data
+    if isinstance(obj, SimpleNamespace):
+        return {key: to_dict(value) for key, value in vars(obj).items()}
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, dict):
+        return {key: to_dict(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_dict(value) for value in obj]
+    return obj
+
+
+def make_request(custom_id: str, model: str, messages: Messages, **body) -> Dict[str, Any]:
+    # the provider prefix picks the endpoint, the request has the provider's own model name
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": CHAT_COMPLETIONS_URL,
+        "body": {"model": model.split(":", 1)[-1], "messages": messages, **body},
+    }
+
+
+def parse_result(line: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Optional[int]]]]:
+    # the content and usage of one result line, or None if that request failed
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        return None
+    body = json.loads(json.dumps(response["body"]), object_hook=lambda fields: SimpleNamespace(**fields))
+    return body.choices[0].message.content, get_usage(body)
+
+
+class BatchEndpoint(ABC):
+    """Where play(batch=True) sends each turn's requests as a JSONL file, e.g. a provider batch API."""
+
+    @abstractmethod
+    def submit(self, path: Path) -> str:
+        # returns a job id
+        pass
+
+    @abstractmethod
+    def status(self, job_id: str) -> str:
+        # one of FINAL_STATUSES once the job is done
+        pass
+
+    @abstractmethod
+    def download(self, job_id: str) -> List[Dict[str, Any]]:
+        # the result lines, including those of failed requests
+        pass
+
+
+class FileBatchEndpoint(BatchEndpoint):
+    """File-based stand-in for a provider batch API, for running batch mode without network.
+
+    Each job is a directory under `directory` holding the submitted input.jsonl. It is completed once output.jsonl
+    exists: written here `latency` seconds after submission by calling `respond` with every request line, or by
+    anything else that processes the input, such as another process.
+    """
+
+    def __init__(self, directory: Path, respond: Optional[Callable[[Dict[str, Any]], Any]] = None, latency: float = 0.0):
+        self.directory = Path(directory)
+        self.respond = respond
+        self.latency = latency
+
+    def submit(self, path: Path) -> str:
+        job_id = f"batch_{uuid.uuid4().hex[:16]}"
+        job = self.directory / job_id
+        job.mkdir(parents=True)
+        shutil.copyfile(path, job / "input.jsonl")
+        (job / "submitted_at").write_text(str(time.time()))
+        return job_id
+
+    def _process(self, job: Path):
+        results = []
+        with open(job / "input.jsonl") as f:
+            for i, line in enumerate(f):
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                result = {"id": f"{job.name}_{i}", "custom_id": request["custom_id"], "response": None, "error": None}
+                try:
+                    result["response"] = {"status_code": 200, "body": to_dict(self.respond(request))}
+                except Exception as e:
+                    result["error"] = {"message": str(e)}
+                results.append(result)
+        # written under another name first, so a reader never sees half a file
+        partial = job / "output.jsonl.partial"
+        with open(partial, "w") as f:
+            f.writelines(json.dumps(result) + "\n" for result in results)
+        partial.replace(job / "output.jsonl")
+
+    def status(self, job_id: str) -> str:
+        job = self.directory / job_id
+        if (job / "output.jsonl").exists():
+            return "completed"
+        if self.respond and time.time() - float((job / "submitted_at").read_text()) >= self.latency:
+            self._process(job)
+            return "completed"
+        return "in_progress"
+
+    def download(self, job_id: str) -> List[Dict[str, Any]]:
+        with open(self.directory / job_id / "output.jsonl") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class OpenAIBatchEndpoint(BatchEndpoint):
+    """OpenAI's batch API, which answers within `completion_window` at a lower price than interactive calls."""
+
+    def __init__(self, client: Any = None, completion_window: str = "24h"):
+        if client is None:
+            import openai
+            client = openai.OpenAI()
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path: Path) -> str:
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=CHAT_COMPLETIONS_URL,
+                                           completion_window=self.completion_window)
+        return batch.id
+
+    def status(self, job_id: str) -> str:
+        return self.client.batches.retrieve(job_id).status
+
+    def download(self, job_id: str) -> List[Dict[str, Any]]:
+        batch = self.client.batches.retrieve(job_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(json.loads(line) for line in self.client.files.content(file_id).text.splitlines() if line.strip())
+        return lines
+
+
+class BatchOnlyClient:
+    """Client for Runners whose responses come from a batch endpoint, so no interactive provider client is set up."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model: str, messages: Messages, **kwargs):
+        raise RuntimeError(f"{model} is answered through a batch endpoint, not interactively")
+
+
+def make_batch_endpoint(model: str, directory: Path, runners: Dict[str, Runner]) -> BatchEndpoint:
+    provider = get_provider(model)
+    if provider == LOCAL_PROVIDER:
+        # each request is answered by its own episode's local client, which knows the episode's puzzle
+        def respond(request: Dict[str, Any]) -> Any:
+            runner = runners[request["custom_id"]]
+            return runner.client.chat.completions.create(model=runner.model, messages=request["body"]["messages"])
+        return FileBatchEndpoint(directory / "jobs", respond=respond)
+    if provider == "openai":
+        return OpenAIBatchEndpoint()
+    raise ValueError(f"No batch endpoint for provider {provider}. Pass one as batch_endpoint")
+
+
+def _run_job(endpoint: BatchEndpoint, path: Path, poll_interval: float, 
+             timeout: Optional[float] = DEFAULT_JOB_TIMEOUT) -> Dict[str, Tuple[str, Dict[str, Optional[int]]]]:
+    job_id = endpoint.submit(path)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while (status := endpoint.status(job_id)) not in FINAL_STATUSES:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Batch job {job_id} for {path} is still {status} after {timeout:g}s")
+        time.sleep(poll_interval if deadline is None else max(0.0, min(poll_interval, deadline - time.monotonic())))
+    answered = {}
+    for line in endpoint.download(job_id):
+        result = parse_result(line)
+        if result is not None:
+            answered[line["custom_id"]] = result
+    return answered
+
+
+def run_batched(runners: Dict[str, Runner], endpoint: BatchEndpoint, directory: Path, max_iterations: int = 30,
+                poll_interval: float = 30.0, max_retries: int = 3, job_timeout: Optional[float] = DEFAULT_JOB_TIMEOUT,
+                on_finish: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Dict[str, Any]]:
+    """Runs the episodes of `runners` in lockstep, with one batch job per turn holding the next request of every live episode.
+
+    Responses found in a Runner's response cache are not submitted. Requests that fail are submitted again in another
+    job, up to max_retries times. A job that has not finished after job_timeout seconds (None waits forever) raises
+    TimeoutError. Each finished episode's results are passed to on_finish(key, results) right away.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    results: Dict[str, Dict[str, Any]] = {}
+    for runner in runners.values():
+        runner.start_episode(max_iterations)
+
+    pending = list(runners)
+    turn = 0
+    while pending:
+        responses: Dict[str, Tuple[str, Optional[Dict], bool]] = {}
+        requests: Dict[str, Dict[str, Any]] = {}
+        for key in pending:
+            runner = runners[key]
+            messages, content = runner.prepare_request()
+            if content is not None:
+                responses[key] = (content, None, True)
+                continue
+            if runner.cache_markers:
+                messages = runner.cache_markers(messages)
+            requests[key] = make_request(key, runner.model, messages, temperature=runner.temperature)
+
+        for attempt in range(max_retries + 1):
+            if not requests:
+                break
+            path = directory / f"turn{turn:04d}_{attempt}.jsonl"
+            with open(path, "w") as f:
+                f.writelines(json.dumps(request) + "\n" for request in requests.values())
+            for key, (content, usage) in _run_job(endpoint, path, poll_interval, job_timeout).items():
+                if key in requests:
+                    responses[key] = (content, usage, False)
+                    del requests[key]
+        if requests:
+            raise RuntimeError(f"{len(requests)} requests of turn {turn} still failed after {max_retries} retries")
+
+        still_running = []
+        for key in pending:
+            runner = runners[key]
+            content, usage, cached = responses[key]
+            if runner.advance(runner.record_response(content, usage, cached=cached)):
+                still_running.append(key)
+            else:
+                results[key] = runner.finish_episode()
+                if on_finish:
+                    on_finish(key, results[key])
+        pending = still_running
+        turn += 1
+    return results
@@ -0,0 +1,570 @@
+import random
+import sys
+import timeit
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from link.puzzles.escaperoom.entities import GridPuzzle, GameObject, Door, Button, Rock, Player
+from link.puzzles.escaperoom.actions import Action, ActionHandler
+import link.puzzles.escaperoom.levels as levels
+from link.puzzles.escaperoom.renderer import GridRenderer
+from link.puzzles.escaperoom.utils import print_puzzle_state, print_object_state, print_player_state
+from link.puzzles.escaperoom.solver import solve
+from link.puzzles.escaperoom.generator import GeneratedLevel, generate_level
+from link.puzzles.escaperoom.runner import Runner
+from link.puzzles.escaperoom.clients import ClientRegistry, LocalClient, OraclePolicy
+
+
+def _scan_objects_at(puzzle: GridPuzzle, position: Tuple[int, int]) -> List[GameObject]:
+    # the original linear scan, kept as the baseline
+    return [obj for obj in puzzle.objects if obj.position == position]
+
+
+def _scan_player_movement(puzzle: GridPuzzle, old_position: Tuple[int, int], new_position: Tuple[int, int]) -> List[str]:
+    # the original hasattr scan over every object in both cells, kept as the baseline
+    results = []
+    for obj in puzzle.get_objects_at(old_position):
+        if hasattr(obj, 'on_leave'):
+            result = obj.on_leave(puzzle.player)
+            if result:
+                results.append(result)
+    for obj in puzzle.get_objects_at(new_position):
+        if hasattr(obj, 'on_enter'):
+            result = obj.on_enter(puzzle.player)
+            if result:
+                results.append(result)
+    return results
+
+
+def _parse_and_execute(handler: ActionHandler, action_str: str) -> str:
+    # the original path, parsing the string on every call, kept as the baseline
+    action = Action._parse(action_str)
+    if action is None:
+        return f"Invalid action format: {action_str}\n{handler.get_action_help()}"
+    return handler.handlers[action.type](action.params)
+
+
+def build_large_puzzle(grid_size: Tuple[int, int] = (100, 100), num_objects: int = 500, seed: int = 0) -> GridPuzzle:
+    rng = random.Random(seed)
+    puzzle = GridPuzzle(grid_size)
+    door = Door((grid_size[0] - 1, grid_size[1] - 1))
+    puzzle.add_object(door)
+    for i in range(num_objects - 1):
+        position = (rng.randrange(grid_size[0]), rng.randrange(grid_size[1]))
+        if i % 2:
+            puzzle.add_object(Button(position, [door], weight_threshold=90))
+        else:
+            puzzle.add_object(Rock(position))
+    return puzzle
+
+
+def bench_object_lookup(width: int = 100, height: int = 100, num_objects: int = 500, lookups: int = 10000, seed: int = 0) -> Dict[str, float]:
+    """Compares GridPuzzle.get_objects_at against the old list scan, in microseconds per lookup."""
+    puzzle = build_large_puzzle((width, height), num_objects, seed)
+    rng = random.Random(seed)
+    positions = [(rng.randrange(width), rng.randrange(height)) for _ in range(lookups)]
+
+    scan = timeit.timeit(lambda: [_scan_objects_at(puzzle, p) for p in positions], number=1)
+    indexed = timeit.timeit(lambda: [puzzle.get_objects_at(p) for p in positions], number=1)
+
+    results = {
+        "scan_us": scan / lookups * 1e6,
+        "indexed_us": indexed / lookups * 1e6,
+        "speedup": scan / indexed,
+    }
+    print(f"{num_objects} objects on {width}x{height}: scan {results['scan_us']:.2f}us, "
+          f"indexed {results['indexed_us']:.2f}us per lookup ({results['speedup']:.1f}x)")
+    return results
+
+
+def bench_snapshot(width: int = 50, height: int = 50, num_objects: int = 50, num_states: int = 10000, seed: int = 0) -> Dict[str, float]:
+    """Measures snapshot/restore time and bytes per stored state on a random walk."""
+    puzzle = build_large_puzzle((width, height), num_objects, seed)
+    handler = ActionHandler(puzzle)
+    rng = random.Random(seed)
+    moves = ["move up", "move down", "move left", "move right", "pick_up rock", "drop rock"]
+
+    states = {}
+    for _ in range(num_states):
+        handler.execute(rng.choice(moves))
+        states[puzzle.snapshot()] = puzzle.steps
+
+    state = next(iter(states))
+    snapshot = timeit.timeit(puzzle.snapshot, number=num_states) / num_states
+    restore = timeit.timeit(lambda: puzzle.restore(state), number=num_states) / num_states
+    rebuild = timeit.timeit(lambda: levels.get_level(1), number=1000) / 1000
+
+    results = {
+        "distinct_states": len(states),
+        "bytes_per_state": sum(sys.getsizeof(s) for s in states) / len(states),
+        "snapshot_us": snapshot * 1e6,
+        "restore_us": restore * 1e6,
+        "rebuild_level_one_us": rebuild * 1e6,
+    }
+    print(f"{num_objects} objects on {width}x{height}: {results['bytes_per_state']:.0f} bytes/state, "
+          f"snapshot {results['snapshot_us']:.1f}us, restore {results['restore_us']:.1f}us "
+          f"(rebuilding level 1 takes {results['rebuild_level_one_us']:.1f}us)")
+    return results
+
+
+def bench_solver(width: int = 50, height: int = 50, num_objects: int = 40, num_puzzles: int = 5, seed: int = 0) -> Dict[str, float]:
+    """Times the optimal solver on random puzzles where every button opens the door."""
+    times, expanded = [], []
+    for i in range(num_puzzles):
+        puzzle = build_large_puzzle((width, height), num_objects, seed + i)
+        elapsed = timeit.timeit(lambda: expanded.append(solve(puzzle).expanded_states), number=1)
+        times.append(elapsed)
+
+    results = {
+        "mean_seconds": sum(times) / len(times),
+        "max_seconds": max(times),
+        "mean_expanded_states": sum(expanded) / len(expanded),
+    }
+    print(f"{num_objects} objects on {width}x{height}: {results['mean_seconds']:.3f}s mean, "
+          f"{results['max_seconds']:.3f}s max, {results['mean_expanded_states']:.0f} states expanded")
+    return results
+
+
+def bench_batch(level: int = 1, num_episodes: int = 2000, num_steps: int = 100, seed: int = 0) -> Dict[str, float]:
+    """Episodes/sec of a random policy, stepping GridPuzzle one episode at a time vs BatchPuzzle."""
+    # numpy is only needed for the batch engine
+    from link.puzzles.escaperoom.batch import BatchPuzzle, get_action_space
+
+    batch = BatchPuzzle(levels.get_level(level).puzzle, num_episodes)
+    action_space = list(get_action_space(batch))
+    rng = random.Random(seed)
+    plan = [[rng.choice(action_space) for _ in range(num_episodes)] for _ in range(num_steps)]
+    codes = [batch.encode_many(actions) for actions in plan]
+
+    def run_single():
+        for i in range(num_episodes):
+            handler = ActionHandler(levels.get_level(level).puzzle)
+            for actions in plan:
+                handler.execute(actions[i])
+
+    def run_batch():
+        env = BatchPuzzle(levels.get_level(level).puzzle, num_episodes)
+        for step_codes in codes:
+            env.step(step_codes)
+
+    single = timeit.timeit(run_single, number=1)
+    batched = timeit.timeit(run_batch, number=1)
+    results = {
+        "single_episodes_per_sec": num_episodes / single,
+        "batch_episodes_per_sec": num_episodes / batched,
+        "speedup": single / batched,
+    }
+    print(f"level {level}, {num_episodes} episodes x {num_steps} steps: GridPuzzle {results['single_episodes_per_sec']:.0f} episodes/s, "
+          f"BatchPuzzle {results['batch_episodes_per_sec']:.0f} episodes/s ({results['speedup']:.1f}x)")
+    return results
+
+
+def bench_render(width: int = 100, height: int = 100, num_objects: int = 200, num_renders: int = 200, seed: int = 0) -> Dict[str, float]:
+    """Time per full state render: the utils print_* functions vs GridRenderer, with one random action between renders."""
+    moves = ["move up", "move down", "move left", "move right", "pick_up rock", "drop rock"]
+
+    def run(render) -> float:
+        puzzle = build_large_puzzle((width, height), num_objects, seed)
+        handler = ActionHandler(puzzle)
+        draw = render(puzzle)
+        rng = random.Random(seed)
+        elapsed = 0.0
+        for _ in range(num_renders):
+            handler.execute(rng.choice(moves))
+            elapsed += timeit.timeit(draw, number=1)
+        return elapsed / num_renders
+
+    def utils_render(puzzle):
+        return lambda: "\n".join([print_puzzle_state(puzzle), print_object_state(puzzle), print_player_state(puzzle)])
+
+    baseline = run(utils_render)
+    incremental = run(lambda puzzle: GridRenderer(puzzle).render_state)
+    results = {"utils_us": baseline * 1e6, "renderer_us": incremental * 1e6, "speedup": baseline / incremental}
+    print(f"{num_objects} objects on {width}x{height}: utils {results['utils_us']:.0f}us, "
+          f"GridRenderer {results['renderer_us']:.0f}us per render ({results['speedup']:.1f}x)")
+    return results
+
+
+def bench_harness(policies: Tuple[str, ...] = ("oracle", "random"), puzzle_levels: Tuple[int, ...] = (1, 2), grid_sizes: Tuple[int, ...] = (8, 16, 32),
+                  num_episodes: int = 5, max_iterations: int = 200, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Episodes/sec and per-turn overhead of Runner itself, using local clients so no provider time is included.
+
+    Overhead is everything in an episode except the client call: prompt rendering, action execution, bookkeeping.
+    Built-in levels are named by number, generated levels by grid size.
+    """
+    puzzles = {f"level {n}": lambda n=n: n for n in puzzle_levels}
+    for size in grid_sizes:
+        level, _ = generate_level(seed, grid_size=(size, size))
+        if level is not None:
+            puzzles[f"{size}x{size}"] = lambda spec=level.spec: GeneratedLevel(spec)
+
+    results = {}
+    for policy in policies:
+        for name, make_level in puzzles.items():
+            turns = 0
+            overhead = 0.0
+            solved = 0
+            start = timeit.default_timer()
+            for _ in range(num_episodes):
+                result = Runner(model=f"local:{policy}", puzzle_level=make_level()).run_eval(max_iterations)
+                turns += len(result["turns"])
+                overhead += result["wall_time"] - result["total_llm_time"]
+                solved += result["is_solved"]
+            elapsed = timeit.default_timer() - start
+            row = {
+                "episodes_per_sec": num_episodes / elapsed,
+                "turn_overhead_us": overhead / turns * 1e6 if turns else 0.0,
+                "solve_rate": solved / num_episodes,
+            }
+            results[f"{policy} {name}"] = row
+            print(f"{policy:>8} {name:>10}: {row['episodes_per_sec']:.1f} episodes/s, "
+                  f"{row['turn_overhead_us']:.0f}us harness overhead per turn, solved {row['solve_rate']:.0%}")
+    return results
+
+
+def bench_processes(processes: Tuple[int, ...] = (1, 2, 4), policy: str = "oracle", puzzle_levels: Tuple[int, ...] = (1, 2), 
+                    num_seeds: int = 200, max_iterations: int = 50) -> Dict[int, float]:
+    """Episodes/sec of play() with local clients for each number of worker processes, including the shard merge."""
+    import contextlib, io, tempfile
+    from link.puzzles.escaperoom.play import play
+
+    results = {}
+    for n in processes:
+        with tempfile.TemporaryDirectory() as directory:
+            start = timeit.default_timer()
+            with contextlib.redirect_stdout(io.StringIO()):
+                play(models=[f"local:{policy}"], puzzles=list(puzzle_levels), seeds=list(range(num_seeds)), max_iterations=max_iterations, 
+                     output=f"{directory}/results.jsonl", processes=n)
+            elapsed = timeit.default_timer() - start
+        results[n] = len(puzzle_levels) * num_seeds / elapsed
+        print(f"{n} processes: {results[n]:.0f} episodes/s ({results[n] / results[processes[0]]:.1f}x)")
+    return results
+
+
+def bench_triggers(num_objects: int = 500, num_moves: int = 2000) -> Dict[str, float]:
+    """Event dispatch and link propagation with hundreds of objects.
+
+    Dispatch: the player steps on and off a cell holding num_objects rocks and one button, comparing the
+    GridPuzzle event bus with the old hasattr scan. Propagation: a button wired through a chain of num_objects
+    buttons (the last also wired back to the first) to the door, pressed and released by stepping on it.
+    """
+    puzzle = GridPuzzle((10, 10))
+    door = Door((9, 9))
+    puzzle.add_object(door)
+    for _ in range(num_objects):
+        puzzle.add_object(Rock((1, 0)))
+    puzzle.add_object(Button((1, 0), [door], weight_threshold=10 ** 6))
+
+    def step_on_off(dispatch):
+        for i in range(num_moves):
+            old, new = ((0, 0), (1, 0)) if i % 2 == 0 else ((1, 0), (0, 0))
+            puzzle.player.position = new
+            dispatch(old, new)
+
+    scan = timeit.timeit(lambda: step_on_off(lambda old, new: _scan_player_movement(puzzle, old, new)), number=1)
+    bus = timeit.timeit(lambda: step_on_off(puzzle.handle_player_movement), number=1)
+
+    chain = GridPuzzle((10, 10))
+    door = Door((9, 9))
+    chain.add_object(door)
+    buttons = [Button((1, 0), [], weight_threshold=100) for _ in range(num_objects)]
+    for button, following in zip(buttons, buttons[1:]):
+        button.linked_objects.append(following)
+    buttons[-1].linked_objects.extend([door, buttons[0]])
+    for button in buttons:
+        chain.add_object(button)
+    cycles = chain.get_link_cycles()
+    presses = max(1, num_moves // 20)
+
+    def press_release():
+        for _ in range(presses):
+            chain.move_player("right")
+            chain.move_player("left")
+
+    propagation = timeit.timeit(press_release, number=1)
+    results = {
+        "scan_us": scan / num_moves * 1e6,
+        "bus_us": bus / num_moves * 1e6,
+        "speedup": scan / bus,
+        "propagation_us_per_hop": propagation / (2 * presses * num_objects) * 1e6,
+        "link_cycles": len(cycles),
+    }
+    print(f"{num_objects} objects in one cell: scan {results['scan_us']:.1f}us, event bus {results['bus_us']:.1f}us per move "
+          f"({results['speedup']:.1f}x); {num_objects}-button chain: {results['propagation_us_per_hop']:.2f}us per hop, "
+          f"{results['link_cycles']} cycle(s) detected")
+    return results
+
+
+def bench_actions(level: int = 2, num_actions: int = 100000, seed: int = 0) -> Dict[str, float]:
+    """Microseconds per action for a random action sequence: parsing every call vs interned actions, one by one and with execute_many."""
+    moves = ["move up", "move down", "move left", "move right", "pick_up rock", "drop rock", "Move Up", "jump"]
+    rng = random.Random(seed)
+    plan = [rng.choice(moves) for _ in range(num_actions)]
+
+    def run(execute) -> float:
+        handler = ActionHandler(levels.get_level(level).puzzle)
+        return timeit.timeit(lambda: execute(handler), number=1) / num_actions
+
+    baseline = run(lambda handler: [_parse_and_execute(handler, a) for a in plan])
+    interned = run(lambda handler: [handler.execute(a) for a in plan])
+    batched = run(lambda handler: handler.execute_many(plan))
+    parsed = [Action.parse(a) for a in plan]
+    precompiled = run(lambda handler: handler.execute_many([a for a in parsed if a is not None]))
+    results = {
+        "parse_each_us": baseline * 1e6,
+        "execute_us": interned * 1e6,
+        "execute_many_us": batched * 1e6,
+        "execute_many_parsed_us": precompiled * 1e6,
+        "speedup": baseline / batched,
+    }
+    print(f"level {level}, {num_actions} actions: parse each {results['parse_each_us']:.2f}us, execute {results['execute_us']:.2f}us, "
+          f"execute_many {results['execute_many_us']:.2f}us ({results['speedup']:.1f}x), "
+          f"execute_many on parsed actions {results['execute_many_parsed_us']:.2f}us per action")
+    return results
+
+
+def _time_import(statement: str, runs: int) -> float:
+    # median seconds over fresh interpreters, so nothing is already imported
+    import subprocess
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    times = sorted(float(subprocess.check_output([sys.executable, "-c", code]).strip()) for _ in range(runs))
+    return times[len(times) // 2]
+
+
+def bench_startup(runs: int = 7, level: int = 2) -> Dict[str, float]:
+    """Cold import time of the package (which no longer imports aisuite or fire) and time to get a level."""
+    import subprocess
+    package = _time_import("import link.puzzles.escaperoom", runs)
+    client = _time_import("import aisuite; aisuite.Client()", runs)
+    loaded = subprocess.check_output([sys.executable, "-c", "import sys, link.puzzles.escaperoom; "
+                                      "print(','.join(m for m in ('aisuite', 'fire', 'numpy', 'sqlalchemy') if m in sys.modules) or 'none')"])
+    template = levels.get_level(level)
+    results = {
+        "package_import_ms": package * 1e3,
+        "aisuite_client_ms": client * 1e3,
+        "get_level_us": timeit.timeit(lambda: levels.get_level(level), number=1000) / 1000 * 1e6,
+        "clone_level_us": timeit.timeit(template.clone, number=1000) / 1000 * 1e6,
+    }
+    print(f"import link.puzzles.escaperoom: {results['package_import_ms']:.1f}ms (heavy modules loaded: {loaded.decode().strip()}); "
+          f"aisuite client, deferred to the first Runner: {results['aisuite_client_ms']:.1f}ms; "
+          f"level {level}: build {results['get_level_us']:.1f}us, clone {results['clone_level_us']:.1f}us")
+    return results
+
+
+def bench_prompt_cache(puzzle_levels: Tuple[int, ...] = (1, 2), grid_size: int = 16, num_episodes: int = 3, 
+                       history_window: int = 8, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Share of prompt tokens a prefix-caching provider could serve from cache, per prompt layout.
+
+    One LocalClient is shared by all episodes of a layout, so prefixes carry over between episodes like they would at a provider.
+    """
+    puzzles = [lambda n=n: n for n in puzzle_levels]
+    level, _ = generate_level(seed, grid_size=(grid_size, grid_size))
+    if level is not None:
+        puzzles.append(lambda spec=level.spec: GeneratedLevel(spec))
+    layouts = {
+        "full": {},
+        "delta": {"prompt_mode": "delta"},
+        f"window {history_window}": {"history_window": history_window},
+    }
+
+    results = {}
+    for name, kwargs in layouts.items():
+        client = LocalClient(OraclePolicy())
+        input_tokens = cached_tokens = 0
+        for _ in range(num_episodes):
+            for make_level in puzzles:
+                result = Runner(model="local:oracle", puzzle_level=make_level(), client=client, **kwargs).run_eval(200)
+                input_tokens += result["total_input_tokens"] or 0
+                cached_tokens += result["total_cached_input_tokens"] or 0
+        row = {
+            "input_tokens": input_tokens,
+            "cached_input_tokens": cached_tokens,
+            "hit_rate": cached_tokens / input_tokens if input_tokens else 0.0,
+        }
+        results[name] = row
+        print(f"{name:>10}: {row['cached_input_tokens']}/{row['input_tokens']} prompt tokens cached ({row['hit_rate']:.0%})")
+    return results
+
+
+def bench_termination(puzzle_levels: Tuple[int, ...] = (1, 2), num_episodes: int = 100, max_iterations: int = 100, 
+                      max_invalid_actions: int = 10, max_state_visits: int = 5, max_no_progress: int = 15, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """LLM calls and solve rate of a random policy with and without early termination of hopeless episodes."""
+    from collections import Counter
+    from link.puzzles.escaperoom.clients import ACTIONS, RandomPolicy
+
+    limits = {"max_invalid_actions": max_invalid_actions, "max_state_visits": max_state_visits, "max_no_progress": max_no_progress}
+    results = {}
+    for name, kwargs in (("off", {}), ("on", limits)):
+        calls = solved = 0
+        reasons: Counter = Counter()
+        for level in puzzle_levels:
+            for episode in range(num_episodes):
+                # one unparsable response among the actions, like a model that sometimes answers in prose
+                client = LocalClient(RandomPolicy(seed=seed + episode, actions=ACTIONS + ["I will move up"]))
+                result = Runner(model="local:random", puzzle_level=level, client=client, **kwargs).run_eval(max_iterations)
+                calls += len(result["turns"])
+                solved += result["is_solved"]
+                reasons[result["termination_reason"]] += 1
+        episodes = num_episodes * len(puzzle_levels)
+        row = {"calls_per_episode": calls / episodes, "solve_rate": solved / episodes, **reasons}
+        results[name] = row
+        print(f"termination {name:>3}: {row['calls_per_episode']:.1f} calls per episode, solved {row['solve_rate']:.0%}, {dict(reasons)}")
+    return results
+
+
+def _start_stub_server(action: str = "move up"):
+    """OpenAI-compatible chat completion server on a free localhost port, counting the connections it accepts."""
+    import json, threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    body = json.dumps({
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": action}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 1},
+    }).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, like a provider API; headers and body go out in one buffered write without Nagle delays
+        protocol_version = "HTTP/1.1"
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            self.server.connections += 1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_clients(num_episodes: int = 200, max_iterations: int = 5, level: int = 1) -> Dict[str, Dict[str, float]]:
+    """Per-episode setup overhead against a local HTTP stub: a new client and connection pool for every Runner 
+    (how play() used to work) vs the process-wide ClientRegistry."""
+    server = _start_stub_server()
+    configs = {"http": {"base_url": f"http://127.0.0.1:{server.server_address[1]}/v1"}}
+    results = {}
+    try:
+        for name in ("per_episode", "shared"):
+            shared = ClientRegistry(configs)
+            connections = server.connections
+            setup = first_call = 0.0
+            start = timeit.default_timer()
+            for _ in range(num_episodes):
+                registry = shared if name == "shared" else ClientRegistry(configs)
+                begin = timeit.default_timer()
+                runner = Runner(model="http:stub", puzzle_level=level, client=registry.get("http:stub"))
+                setup += timeit.default_timer() - begin
+                result = runner.run_eval(max_iterations)
+                first_call += result["turns"][0]["llm_latency"]
+                if registry is not shared:
+                    registry.close()
+            elapsed = timeit.default_timer() - start
+            shared.close()
+            row = {
+                "episode_ms": elapsed / num_episodes * 1e3,
+                "setup_ms": setup / num_episodes * 1e3,
+                "first_call_ms": first_call / num_episodes * 1e3,
+                "connections": server.connections - connections,
+            }
+            results[name] = row
+            print(f"{name:>11}: {row['episode_ms']:.2f}ms per episode, Runner setup {row['setup_ms']:.2f}ms, "
+                  f"first call {row['first_call_ms']:.2f}ms, {row['connections']} connections for {num_episodes} episodes")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def bench_streaming(ramble: Tuple[int, ...] = (0, 50, 200), token_latency: float = 0.001, level: int = 2, 
+                    num_episodes: int = 3) -> Dict[str, Dict[str, float]]:
+    """Time to the first action and output tokens per episode for an oracle that explains each action in `ramble` words,
+    waiting for whole responses vs streaming and stopping after the action line."""
+    results = {}
+    for words in ramble:
+        rows = {}
+        for stream in (False, True):
+            first_action = output_tokens = 0.0
+            for _ in range(num_episodes):
+                client = LocalClient(OraclePolicy(), ramble=words, token_latency=token_latency)
+                result = Runner(model="local:oracle", puzzle_level=level, client=client, stream=stream).run_eval(50)
+                first_action += result["time_to_first_action"]
+                output_tokens += result["total_output_tokens"] or 0
+            rows[stream] = {"time_to_first_action_ms": first_action / num_episodes * 1e3, "output_tokens": output_tokens / num_episodes}
+        row = {
+            "time_to_first_action_ms": rows[False]["time_to_first_action_ms"],
+            "streamed_time_to_first_action_ms": rows[True]["time_to_first_action_ms"],
+            "output_tokens": rows[False]["output_tokens"],
+            "streamed_output_tokens": rows[True]["output_tokens"],
+            "output_tokens_saved": rows[False]["output_tokens"] - rows[True]["output_tokens"],
+        }
+        results[f"ramble {words}"] = row
+        print(f"ramble {words:>4}: first action {row['time_to_first_action_ms']:.1f}ms -> {row['streamed_time_to_first_action_ms']:.1f}ms, "
+              f"output tokens per episode {row['output_tokens']:.0f} -> {row['streamed_output_tokens']:.0f}")
+    return results
+
+
+def _instance_bytes(obj) -> int:
+    # the object itself plus its attribute dict, if it has one; attribute values are not counted
+    return sys.getsizeof(obj) + (sys.getsizeof(obj.__dict__) if hasattr(obj, '__dict__') else 0)
+
+
+def bench_memory(sizes: Tuple[int, ...] = (500, 20000, 100000), clones: int = 20, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Bytes per entity instance, and bytes per object and per puzzle for random puzzles with one object per 4 cells."""
+    door, rock, player = Door((0, 0)), Rock((0, 0)), Player((0, 0))
+    results: Dict[str, Dict[str, float]] = {"instance_bytes": {
+        "door": _instance_bytes(door),
+        "button": _instance_bytes(Button((0, 0), [door])),
+        "rock": _instance_bytes(rock),
+        "player": _instance_bytes(player),
+    }}
+    print("instance bytes: " + ", ".join(f"{name} {size}" for name, size in results["instance_bytes"].items()))
+    for num_objects in sizes:
+        side = int((4 * num_objects) ** 0.5)
+        tracemalloc.start()
+        puzzle = build_large_puzzle((side, side), num_objects, seed)
+        puzzle_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        clone = timeit.timeit(puzzle.clone, number=clones) / clones
+        row = {
+            "puzzle_bytes": puzzle_bytes,
+            "bytes_per_object": puzzle_bytes / num_objects,
+            "clone_ms": clone * 1e3,
+        }
+        results[f"{num_objects} objects"] = row
+        print(f"{num_objects:>6} objects on {side}x{side}: {row['puzzle_bytes'] / 2**20:.1f} MiB, "
+              f"{row['bytes_per_object']:.0f} bytes/object, clone {row['clone_ms']:.1f}ms")
+    return results
+
+
+if __name__ == '__main__':
+    import fire
+    fire.Fire({
+        "lookup": bench_object_lookup,
+        "snapshot": bench_snapshot,
+        "solver": bench_solver,
+        "batch": bench_batch,
+        "render": bench_render,
+        "harness": bench_harness,
+        "processes": bench_processes,
+        "triggers": bench_triggers,
+        "actions": bench_actions,
+        "startup": bench_startup,
+        "prompt_cache": bench_prompt_cache,
+        "termination": bench_termination,
+        "clients": bench_clients,
+        "streaming": bench_streaming,
+        "memory": bench_memory,
+    })
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+CACHE_MODES = ("off", "readwrite", "record", "replay")
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+class ResponseCache:
+    """On-disk cache of completions keyed on model, temperature, the exact messages sent and the episode's seed.
+
+    Modes:
+        off: never read or write.
+        readwrite: return cached responses and store new ones.
+        record: always call the provider and store (overwrite) the response.
+        replay: only return cached responses; a miss raises CacheMiss instead of calling the provider.
+    Least recently used entries are evicted once the cache is larger than max_bytes.
+    """
+
+    def __init__(self, directory: str = ".cache/responses", mode: str = "readwrite", max_bytes: int = 512 * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode}. Choose from {CACHE_MODES}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.total_bytes = sum(path.stat().st_size for path in self.directory.glob("*/*.json"))
+
+    @staticmethod
+    def get_key(model: str, temperature: float, messages: List[Dict[str, str]], seed: int = 0, stream: bool = False) -> str:
+        fields = {"model": model, "temperature": temperature, "messages": messages}
+        if seed:
+            # repetitions of a (model, level) pair send the same messages but must not replay each other's responses;
+            # seed 0 keeps the keys of single runs
+            fields["seed"] = seed
+        if stream:
+            # streamed responses are cut after their action line and must not be served to runs that read whole responses
+            fields["stream"] = True
+        payload = json.dumps(fields, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        # two-level layout keeps directories small for large caches
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        if self.mode in ("off", "record"):
+            return None
+        path = self._path(key)
+        try:
+            content = json.loads(path.read_text())["content"]
+            # the modification time doubles as the last-used time for eviction
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                self.misses += 1
+            if self.mode == "replay":
+                raise CacheMiss(key)
+            return None
+        with self.lock:
+            self.hits += 1
+        return content
+
+    def put(self, key: str, content: str):
+        if self.mode in ("off", "replay"):
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = json.dumps({"content": content})
+        # write then rename so concurrent readers never see a partial file
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(data)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp, path)
+        with self.lock:
+            self.total_bytes += len(data.encode()) - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # oldest first, down to 90% of the limit so eviction does not run on every write
+        files = sorted(self.directory.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                size = path.stat().st_size
+                path.unlink()
+                self.total_bytes -= size
+            except OSError:
+                continue
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "bytes": self.total_bytes}
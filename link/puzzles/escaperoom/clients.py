@@ -0,0 +1,408 @@
+from abc import ABC, abstractmethod
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol, Sequence, Union
+
+from link.puzzles.escaperoom.actions import ActionHandler
+from link.puzzles.escaperoom.entities import GridPuzzle
+from link.puzzles.escaperoom.scheduler import get_provider
+from link.puzzles.escaperoom.solver import solve
+from link.puzzles.escaperoom.utils import estimate_tokens
+
+Messages = List[Dict[str, Any]]
+
+LOCAL_PROVIDER = "local"
+ACTIONS = ["move up", "move down", "move left", "move right", "pick_up rock", "drop rock"]
+# prompt prefixes LocalClient remembers for its simulated prompt cache
+MAX_CACHED_PREFIXES = 4096
+
+
+def get_text(content: Union[str, List[Dict[str, Any]]]) -> str:
+    # message content is a string, or a list of content blocks once cache markers are added
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def add_cache_markers(messages: Messages) -> Messages:
+    # Anthropic-style breakpoints on the system prompt and the newest message: the provider caches the prompt up to
+    # each marker, and the next turn reads the longest cached prefix back
+    marked = list(messages)
+    for i in sorted({0, len(marked) - 1}):
+        message = marked[i]
+        marked[i] = {**message, "content": [
+            {"type": "text", "text": get_text(message["content"]), "cache_control": {"type": "ephemeral"}}
+        ]}
+    return marked
+
+
+# providers that only cache prompts with explicit markers; others (e.g. openai) cache long prefixes automatically.
+# local accepts the same markers so the marked request path can be run offline
+CACHE_MARKERS: Dict[str, Callable[[Messages], Messages]] = {
+    "anthropic": add_cache_markers,
+    LOCAL_PROVIDER: add_cache_markers,
+}
+
+
+class ChatClient(Protocol):
+    """What Runner needs from a client: `client.chat.completions.create(model=..., messages=..., **kwargs)`
+    returning an OpenAI-style response. aisuite.Client and LocalClient both fit."""
+
+    chat: Any
+
+
+class Policy(ABC):
+    """Decides the next action for a LocalClient. bind() is called once with the Runner's puzzle."""
+
+    def bind(self, puzzle: GridPuzzle):
+        pass
+
+    @abstractmethod
+    def __call__(self, messages: Messages) -> str:
+        pass
+
+
+class ScriptedPolicy(Policy):
+    def __init__(self, actions: Sequence[str], repeat: bool = True):
+        self.actions = itertools.cycle(actions) if repeat else iter(actions)
+
+    def __call__(self, messages: Messages) -> str:
+        return next(self.actions, "")
+
+
+class RandomPolicy(Policy):
+    def __init__(self, seed: Optional[int] = None, actions: Sequence[str] = ACTIONS):
+        self.rng = random.Random(seed)
+        self.actions = list(actions)
+
+    def __call__(self, messages: Messages) -> str:
+        return self.rng.choice(self.actions)
+
+
+class OraclePolicy(Policy):
+    """Follows an optimal solution from the solver, planning again if the puzzle is not where the plan expects."""
+
+    def __init__(self):
+        self.puzzle: Optional[GridPuzzle] = None
+        self.plan: List[str] = []
+        self.expected = None
+
+    def bind(self, puzzle: GridPuzzle):
+        self.puzzle = puzzle
+
+    def __call__(self, messages: Messages) -> str:
+        if self.puzzle is None:
+            raise RuntimeError("OraclePolicy needs bind() with the puzzle before use")
+        state = self.puzzle.snapshot()
+        if not self.plan or state != self.expected:
+            solution = solve(self.puzzle)
+            self.plan = list(solution.actions) if solution else []
+        if not self.plan:
+            return "move up"
+        action = self.plan.pop(0)
+        # where the puzzle should be next time, if the action is applied
+        steps = self.puzzle.steps
+        ActionHandler(self.puzzle).execute(action)
+        self.expected = self.puzzle.snapshot()
+        self.puzzle.restore(state)
+        self.puzzle.steps = steps
+        return action
+
+
+class _Completions:
+    def __init__(self, client: 'LocalClient'):
+        self.client = client
+
+    def create(self, model: str, messages: Messages, **kwargs) -> SimpleNamespace:
+        return self.client.complete(model, messages, **kwargs)
+
+
+# what a verbose model adds after its action, repeated to make up `ramble` words
+RAMBLE = "I chose this action because it brings me closer to the door and keeps my options open."
+
+
+class LocalClient:
+    """Offline stand-in for aisuite.Client, answering with a Policy after an optional artificial latency.
+
+    Like a provider with prompt caching, it reports the tokens of the longest message prefix it has seen before
+    as `usage.prompt_tokens_details.cached_tokens`. `ramble` adds that many words of explanation after the action, 
+    and generating each word after the first takes `token_latency` seconds; with stream=True the response comes as 
+    OpenAI-style chunks of one word each.
+    """
+
+    def __init__(self, policy: Policy, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None, 
+                 ramble: int = 0, token_latency: float = 0.0):
+        self.policy = policy
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.ramble = ramble
+        self.token_latency = token_latency
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self._prefixes: OrderedDict = OrderedDict()
+        self._prefix_lock = threading.Lock()
+
+    def bind(self, puzzle: GridPuzzle):
+        self.policy.bind(puzzle)
+
+    def _cached_tokens(self, messages: Messages) -> int:
+        # each prefix is keyed by a hash chained over its messages, so shared clients can cache several conversations
+        cached = tokens = 0
+        key = None
+        with self._prefix_lock:
+            for message in messages:
+                text = get_text(message["content"])
+                key = hash((key, message["role"], text))
+                tokens += estimate_tokens(text)
+                if key in self._prefixes:
+                    self._prefixes.move_to_end(key)
+                    cached = tokens
+                else:
+                    self._prefixes[key] = None
+            while len(self._prefixes) > MAX_CACHED_PREFIXES:
+                self._prefixes.popitem(last=False)
+        return cached
+
+    def _stream(self, words: List[str], usage: SimpleNamespace) -> Iterator[SimpleNamespace]:
+        # like OpenAI's stream_options={"include_usage": True}: usage comes in a last chunk without choices
+        for i, word in enumerate(words):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=word))], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    def complete(self, model: str, messages: Messages, stream: bool = False, **kwargs) -> Union[SimpleNamespace, Iterator[SimpleNamespace]]:
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        content = self.policy(messages)
+        if self.ramble:
+            words = (RAMBLE.split() * (self.ramble // len(RAMBLE.split()) + 1))[:self.ramble]
+            content += "\n" + " ".join(words)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(estimate_tokens(get_text(m["content"])) for m in messages),
+            completion_tokens=estimate_tokens(content),
+            prompt_tokens_details=SimpleNamespace(cached_tokens=self._cached_tokens(messages)),
+        )
+        words = re.split(r"(?<=\s)", content)
+        if stream:
+            return self._stream(words, usage)
+        if self.token_latency:
+            # the whole response is generated before any of it is returned
+            time.sleep(self.token_latency * (len(words) - 1))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))],
+            usage=usage,
+        )
+
+
+POLICIES: Dict[str, Callable[[], Policy]] = {
+    "random": RandomPolicy,
+    "oracle": OraclePolicy,
+}
+
+
+def make_local_client(model: str) -> LocalClient:
+    # "local:<policy>" or "local:<policy>:<latency in seconds>", e.g. "local:oracle:0.2"
+    parts = model.split(":")
+    if parts[0] != LOCAL_PROVIDER or len(parts) < 2 or parts[1] not in POLICIES:
+        raise ValueError(f"Unknown local model {model}. Use local:<policy>[:<latency>] with policy in {list(POLICIES)}")
+    latency = float(parts[2]) if len(parts) > 2 else 0.0
+    return LocalClient(POLICIES[parts[1]](), latency=latency)
+
+
+# providers whose SDK client (openai.OpenAI, anthropic.Anthropic and clients generated like them) accepts an httpx pool
+POOLED_PROVIDERS = {"openai", "anthropic", "groq", "sambanova"}
+# providers aisuite calls with a one-off httpx.post, which only take a timeout
+TIMEOUT_PROVIDERS = {"ollama", "xai", "fireworks", "together", "huggingface"}
+# "http:<model>" talks to an OpenAI-compatible server at provider_configs["http"]["base_url"]
+HTTP_PROVIDER = "http"
+# providers whose client returns stream=True responses as OpenAI-style chunks; aisuite's other adapters normalize
+# the response (anthropic, cohere, watsonx) or turn streaming off (azure, ollama)
+STREAMING_PROVIDERS = {"openai", "groq", "sambanova", HTTP_PROVIDER, LOCAL_PROVIDER}
+# of those, the ones that send usage in a last chunk when asked with stream_options={"include_usage": True}
+STREAM_USAGE_PROVIDERS = {"openai", "sambanova", HTTP_PROVIDER, LOCAL_PROVIDER}
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60.0
+
+
+def make_http_pool(pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+    # httpx comes with the provider SDKs; imported here so local runs do not need it
+    import httpx
+    return httpx.Client(limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size), timeout=timeout)
+
+
+class HttpClient:
+    """Client for OpenAI-compatible chat completion servers (vLLM, llama.cpp, a local stub) over one httpx connection pool."""
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, pool=None, pool_size: int = DEFAULT_POOL_SIZE, 
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.http = pool if pool is not None else make_http_pool(pool_size, timeout)
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def _stream(self, body: Dict[str, Any]) -> Iterator[SimpleNamespace]:
+        # server-sent events; closing the generator early closes the response
+        with self.http.stream("POST", f"{self.base_url}/chat/completions", headers=self.headers, json=body) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                yield json.loads(data, object_hook=lambda fields: SimpleNamespace(**fields))
+
+    def complete(self, model: str, messages: Messages, **kwargs) -> Union[SimpleNamespace, Iterator[SimpleNamespace]]:
+        # the "http:" prefix only selects this client
+        body = {"model": model.split(":", 1)[-1], "messages": messages, **kwargs}
+        if kwargs.get("stream"):
+            return self._stream(body)
+        response = self.http.post(f"{self.base_url}/chat/completions", headers=self.headers, json=body)
+        response.raise_for_status()
+        return json.loads(response.content, object_hook=lambda fields: SimpleNamespace(**fields))
+
+    def close(self):
+        self.http.close()
+
+
+def keep_usage(client: Any) -> Any:
+    # aisuite rebuilds some providers' responses in OpenAI's shape without the usage the API reported (anthropic's
+    # normalize_response keeps only the text), which hides token and prompt cache counts; copy it over
+    for provider in getattr(client, "providers", {}).values():
+        normalize = getattr(provider, "normalize_response", None)
+        if normalize is not None:
+            provider.normalize_response = _with_usage(normalize)
+    return client
+
+
+def _with_usage(normalize: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def normalize_response(response: Any) -> Any:
+        normalized = normalize(response)
+        if getattr(normalized, "usage", None) is None:
+            normalized.usage = getattr(response, "usage", None)
+        return normalized
+    return normalize_response
+
+
+class ClientRegistry:
+    """Chat clients shared by every Runner in the process, one per provider.
+
+    Provider SDK setup and HTTP keep-alive connections are reused across episodes instead of being rebuilt for each.
+    `local:` models still get a new LocalClient per Runner, since policies keep per-episode state.
+    """
+
+    def __init__(self, provider_configs: Optional[Dict[str, Dict[str, Any]]] = None, pool_size: int = DEFAULT_POOL_SIZE, 
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.provider_configs = dict(provider_configs or {})
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._clients: Dict[str, ChatClient] = {}
+        # providers whose client was built here (not register()ed), and the pools they use
+        self._owned: set = set()
+        self._pools: List[Any] = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _check_process(self):
+        # a forked worker must not share the parent's sockets: forget (without closing) the clients built before the fork
+        if self._pid != os.getpid():
+            for provider in self._owned:
+                self._clients.pop(provider, None)
+            self._owned, self._pools, self._pid = set(), [], os.getpid()
+
+    def _create(self, provider: str) -> ChatClient:
+        config = dict(self.provider_configs.get(provider, {}))
+        if provider == HTTP_PROVIDER:
+            if "base_url" not in config:
+                raise ValueError(f"The {HTTP_PROVIDER} provider needs provider_configs={{'{HTTP_PROVIDER}': {{'base_url': ...}}}}")
+            pool = make_http_pool(self.pool_size, self.timeout)
+            self._pools.append(pool)
+            return HttpClient(pool=pool, **config)
+        if provider in POOLED_PROVIDERS and "http_client" not in config:
+            config["http_client"] = make_http_pool(self.pool_size, self.timeout)
+            self._pools.append(config["http_client"])
+            config.setdefault("timeout", self.timeout)
+        elif provider in TIMEOUT_PROVIDERS:
+            config.setdefault("timeout", self.timeout)
+        # imported here rather than at module level: aisuite pulls in every provider SDK
+        import aisuite as ai
+        return keep_usage(ai.Client({provider: config}))
+
+    def get(self, model: str) -> ChatClient:
+        provider = get_provider(model)
+        if provider == LOCAL_PROVIDER:
+            return make_local_client(model)
+        with self._lock:
+            self._check_process()
+            client = self._clients.get(provider)
+            if client is None:
+                client = self._clients[provider] = self._create(provider)
+                self._owned.add(provider)
+        return client
+
+    def can_stream(self, model: str) -> bool:
+        # a register()ed client is trusted to stream; clients built here only for STREAMING_PROVIDERS
+        provider = get_provider(model)
+        with self._lock:
+            registered = provider in self._clients and provider not in self._owned
+        return registered or provider in STREAMING_PROVIDERS
+
+    def register(self, provider: str, client: ChatClient):
+        # e.g. a stub client in tests; it is used for every model of the provider and never closed here
+        with self._lock:
+            self._clients[provider] = client
+            self._owned.discard(provider)
+
+    def _close_owned(self):
+        for pool in self._pools:
+            pool.close()
+        for provider in self._owned:
+            self._clients.pop(provider, None)
+        self._owned, self._pools = set(), []
+
+    def configure(self, pool_size: Optional[int] = None, timeout: Optional[float] = None, 
+                  provider_configs: Optional[Dict[str, Dict[str, Any]]] = None):
+        # clients built with other settings are closed and built again on next use
+        with self._lock:
+            self._check_process()
+            settings = (self.pool_size, self.timeout, self.provider_configs)
+            self.pool_size = self.pool_size if pool_size is None else pool_size
+            self.timeout = self.timeout if timeout is None else timeout
+            if provider_configs is not None:
+                self.provider_configs = {**self.provider_configs, **provider_configs}
+            if settings != (self.pool_size, self.timeout, self.provider_configs):
+                self._close_owned()
+
+    def close(self):
+        with self._lock:
+            self._check_process()
+            self._close_owned()
+
+
+_registry: Optional[ClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
+
+
+def set_client_registry(registry: Optional[ClientRegistry]) -> Optional[ClientRegistry]:
+    # returns the previous registry, so tests can put it back
+    global _registry
+    with _registry_lock:
+        previous, _registry = _registry, registry
+    return previous
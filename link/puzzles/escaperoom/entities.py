@@ -1,21 +1,93 @@
-from typing import Tuple, List
+from typing import Any, Callable, Iterator, Tuple, List, Dict, Optional, Type, TypeVar
 from abc import ABC
+from collections import deque
+import struct
+
+# events an object can listen for in its own cell, and the method handling each
+# enter/leave: the player stepped onto/off the cell; drop/pick_up: the player dropped/picked up an item there
+EVENT_HANDLERS = {"enter": "on_enter", "leave": "on_leave", "drop": "on_drop", "pick_up": "on_pick_up"}
+# what a linked object is told when the object linking to it is triggered or released
+SIGNAL_HANDLERS = {True: "activate", False: "deactivate"}
+
+_dispatch_tables: Dict[type, Dict[Any, Callable]] = {}
+
+
+def get_dispatch_table(cls: type) -> Dict[Any, Callable]:
+    # event/signal -> unbound handler, for the handlers cls actually has; built once per type
+    table = _dispatch_tables.get(cls)
+    if table is None:
+        names = {**EVENT_HANDLERS, **SIGNAL_HANDLERS}
+        table = {key: getattr(cls, name) for key, name in names.items() if callable(getattr(cls, name, None))}
+        _dispatch_tables[cls] = table
+    return table
+
+
+_slot_names: Dict[type, Tuple[str, ...]] = {}
+_UNSET = object()
+
+
+def get_slot_names(cls: type) -> Tuple[str, ...]:
+    # the __slots__ attributes of cls and its bases; built once per type
+    names = _slot_names.get(cls)
+    if names is None:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get('__slots__', ())
+            for name in (slots,) if isinstance(slots, str) else slots:
+                if name not in ('__dict__', '__weakref__') and name not in names:
+                    names.append(name)
+        names = _slot_names[cls] = tuple(names)
+    return names
+
+
+def iter_attributes(obj: Any) -> Iterator[Tuple[str, Any]]:
+    # the attributes obj has set, from its slots and, for subclasses without __slots__, its __dict__
+    for name in get_slot_names(obj.__class__):
+        value = getattr(obj, name, _UNSET)
+        if value is not _UNSET:
+            yield name, value
+    if obj.__class__.__dictoffset__:
+        yield from obj.__dict__.items()
+
+
+def propagate(source: "GameObject", active: bool):
+    # tells source's linked objects it was triggered (active) or released; see GridPuzzle.propagate
+    if source.puzzle is not None:
+        source.puzzle.propagate(source, active)
+        return
+    for obj in getattr(source, 'linked_objects', ()):
+        handler = get_dispatch_table(type(obj)).get(active)
+        if handler:
+            handler(obj)
+
 
 class GameObject(ABC):
+    # no per-instance __dict__, so large grids stay small; fixed texts such as description are class attributes
+    __slots__ = ("nickname", "position", "puzzle")
+    # whether the player can pick it up; only rocks are meant to be carried
+    carryable = False
+
     def __init__(self, position: Tuple[int, int]):
         self.nickname = ""
         self.position = position
+        # set by GridPuzzle.add_object so moves keep the puzzle's position index up to date
+        self.puzzle: Optional["GridPuzzle"] = None
 
     def set_position(self, new_position): 
+        old_position = self.position
         self.position = new_position
+        if self.puzzle is not None:
+            self.puzzle._update_position(self, old_position)
         return self.position
 
 
 class Door(GameObject):
+    __slots__ = ("open",)
+    description = "There is a simple door."
+
     def __init__(self, position: Tuple[int, int]):
         super().__init__(position)
         self.open = False
-        self.description = f"There is a simple door."
 
     def activate(self):
         self.open = True
@@ -34,13 +106,15 @@ class Door(GameObject):
 
 # interactables
 class Button(GameObject):
+    __slots__ = ("pressed", "linked_objects", "weight_threshold", "current_weight")
+    description = "There is a button on the floor. You can press it."
+
     def __init__(self, position: Tuple[int, int], linked_objects: List[GameObject], weight_threshold: int = 50):
         super().__init__(position)
         self.pressed = False
         self.linked_objects = linked_objects
         self.weight_threshold = weight_threshold
         self.current_weight = 0
-        self.description = "There is a button on the floor. You can press it."
 
     def add_weight(self, weight):
         self.current_weight += weight
@@ -62,6 +136,14 @@ class Button(GameObject):
         weight = getattr(obj, 'weight', 0)
         return self.remove_weight(weight)
 
+    def on_drop(self, obj):
+        weight = getattr(obj, 'weight', 0)
+        return self.add_weight(weight)
+
+    def on_pick_up(self, obj):
+        weight = getattr(obj, 'weight', 0)
+        return self.remove_weight(weight)
+
     def activate(self): 
         return self.press()
     
@@ -71,18 +153,14 @@ class Button(GameObject):
     def press(self):
         if not self.pressed:
             self.pressed = True
-            for obj in self.linked_objects:
-                if hasattr(obj, 'activate'):
-                    obj.activate()
+            propagate(self, True)
             return "The button sinks under the weight. You hear a click. The button is pressed."
         return None
 
     def unpress(self):
         if self.pressed:
             self.pressed = False
-            for obj in self.linked_objects:
-                if hasattr(obj, 'deactivate'):
-                    obj.deactivate()
+            propagate(self, False)
             return "The button rises as the weight is removed. You hear another click. The button is unpressed."
         return None    
 
@@ -94,6 +172,9 @@ class Button(GameObject):
 
 # Objects
 class Rock(GameObject):
+    __slots__ = ("weight",)
+    carryable = True
+
     def __init__(self, position: Tuple[int, int], weight: int = 100):
         super().__init__(position)
         self.weight = 100 # pounds
@@ -125,6 +206,8 @@ class Rock(GameObject):
 
 # Player
 class Player:
+    __slots__ = ("position", "inventory", "weight")
+
     def __init__(self, position: Tuple[int, int]):
         self.position = position
         # later, we can have a maximum weight in inventory
@@ -147,19 +230,180 @@ class Player:
         return True
     
 
+def _without(objects: Tuple[GameObject, ...], obj: GameObject) -> Tuple[GameObject, ...]:
+    i = objects.index(obj)
+    return objects[:i] + objects[i + 1:]
+
+
+def _set_cell(cells: Dict[Tuple[int, int], Tuple[GameObject, ...]], position: Tuple[int, int],
+              objects: Tuple[GameObject, ...], shared: Tuple[GameObject, ...]) -> Tuple[GameObject, ...]:
+    # a listener tuple usually has the same objects as its cell, so the cell's tuple is stored instead of a copy
+    if not objects:
+        cells.pop(position, None)
+        return objects
+    if objects == shared:
+        objects = shared
+    cells[position] = objects
+    return objects
+
+
+T = TypeVar("T", bound=GameObject)
+
+# packed bytes from GridPuzzle.snapshot(): hashable, comparable and usable as a dict key
+PuzzleState = bytes
+
 class GridPuzzle:
     def __init__(self, grid_size: Tuple[int, int]):
         self.grid_size = grid_size
         self.player = Player((0, 0))
         self.objects: List[GameObject] = []
         self.steps = 0
+        # indexes over self.objects (objects on the grid, not the inventory), kept in the same order
+        # cells are tuples, which take less memory than lists and are replaced rather than changed in place
+        self._objects_by_position: Dict[Tuple[int, int], Tuple[GameObject, ...]] = {}
+        self._objects_by_type: Dict[type, List[GameObject]] = {}
+        # every object ever added, whether on the grid or held; its index is the object's id in a snapshot
+        self._entities: List[GameObject] = []
+        self._buttons: List[Button] = []
+        self._doors: List[Door] = []
+        self._state_format: Optional[struct.Struct] = None
+        # per event, per cell: the objects on the grid listening for it, in the same order as the cell
+        self._listeners: Dict[str, Dict[Tuple[int, int], Tuple[GameObject, ...]]] = {event: {} for event in EVENT_HANDLERS}
+        # link signals waiting to be delivered by propagate()
+        self._signals: deque = deque()
+        self._propagating = False
 
     # set up puzzle 
     def add_object(self, obj: GameObject):
+        obj.puzzle = self
+        self._entities.append(obj)
+        if isinstance(obj, Button):
+            self._buttons.append(obj)
+        elif isinstance(obj, Door):
+            self._doors.append(obj)
+        self._state_format = None
+        self._place_object(obj)
+
+    # index maintenance 
+    def _place_object(self, obj: GameObject):
         self.objects.append(obj)
+        self._add_to_cell(obj, obj.position)
+        self._objects_by_type.setdefault(type(obj), []).append(obj)
+
+    def _remove_object(self, obj: GameObject):
+        self.objects.remove(obj)
+        self._remove_from_cell(obj, obj.position)
+        self._objects_by_type[type(obj)].remove(obj)
+
+    def _add_to_cell(self, obj: GameObject, position: Tuple[int, int]):
+        cells = self._objects_by_position
+        cell = cells[position] = cells.get(position, ()) + (obj,)
+        for event in get_dispatch_table(type(obj)):
+            if event in EVENT_HANDLERS:
+                listeners = self._listeners[event]
+                _set_cell(listeners, position, listeners.get(position, ()) + (obj,), cell)
+
+    def _remove_from_cell(self, obj: GameObject, position: Tuple[int, int]):
+        cells = self._objects_by_position
+        cell = _set_cell(cells, position, _without(cells[position], obj), ())
+        for event in get_dispatch_table(type(obj)):
+            if event in EVENT_HANDLERS:
+                listeners = self._listeners[event]
+                _set_cell(listeners, position, _without(listeners[position], obj), cell)
+
+    def _update_position(self, obj: GameObject, old_position: Tuple[int, int]):
+        # objects in the inventory are not on the grid, so there is nothing to move
+        if obj in self._objects_by_position.get(old_position, ()):
+            self._remove_from_cell(obj, old_position)
+            self._add_to_cell(obj, obj.position)
+
+    # events 
+    def emit(self, event: str, position: Tuple[int, int], arg) -> List[str]:
+        # calls the listeners for event in the cell, returning the messages they produced
+        results = []
+        for obj in self._listeners[event].get(position, ()):
+            result = get_dispatch_table(type(obj))[event](obj, arg)
+            if result:
+                results.append(result)
+        return results
+
+    def propagate(self, source: GameObject, active: bool):
+        """Delivers a trigger (active) or release from source along linked_objects, breadth first.
+
+        Linked objects that are themselves linked (e.g. a button wired to another button) pass the signal on,
+        so chains of any length work without recursion. Each object receives a given signal at most once per
+        propagation, which stops cycles in the link graph from looping.
+        """
+        self._signals.append((source, active))
+        if self._propagating:
+            # called from a handler further up the stack; the loop below delivers it
+            return
+        self._propagating = True
+        delivered = set()
+        try:
+            while self._signals:
+                source, active = self._signals.popleft()
+                for obj in getattr(source, 'linked_objects', ()):
+                    if (id(obj), active) in delivered:
+                        continue
+                    delivered.add((id(obj), active))
+                    handler = get_dispatch_table(type(obj)).get(active)
+                    if handler:
+                        handler(obj)
+        finally:
+            self._signals.clear()
+            self._propagating = False
+
+    def get_link_cycles(self) -> List[List[GameObject]]:
+        # groups of objects that can reach each other through linked_objects (strongly connected components
+        # of the link graph, Tarjan's algorithm without recursion), in the order they were added
+        order = {id(obj): i for i, obj in enumerate(self._entities)}
+        index: Dict[int, int] = {}
+        low: Dict[int, int] = {}
+        stack: List[GameObject] = []
+        on_stack = set()
+        cycles = []
+        for root in self._entities:
+            if id(root) in index:
+                continue
+            work = [(root, iter(getattr(root, 'linked_objects', ())))]
+            index[id(root)] = low[id(root)] = len(index)
+            stack.append(root)
+            on_stack.add(id(root))
+            while work:
+                obj, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if id(child) not in index:
+                        index[id(child)] = low[id(child)] = len(index)
+                        stack.append(child)
+                        on_stack.add(id(child))
+                        work.append((child, iter(getattr(child, 'linked_objects', ()))))
+                    elif id(child) in on_stack:
+                        low[id(obj)] = min(low[id(obj)], index[id(child)])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[id(parent)] = min(low[id(parent)], low[id(obj)])
+                if low[id(obj)] == index[id(obj)]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(id(member))
+                        component.append(member)
+                        if member is obj:
+                            break
+                    if len(component) > 1 or obj in getattr(obj, 'linked_objects', ()):
+                        cycles.append(sorted(component, key=lambda o: order.get(id(o), len(order))))
+        return cycles
 
     def get_objects_at(self, position: Tuple[int, int]) -> List[GameObject]:
-        return [obj for obj in self.objects if obj.position == position]
+        return list(self._objects_by_position.get(position, ()))
+
+    def get_objects_of_type(self, cls: Type[T]) -> List[T]:
+        # exact type match, in the same order as self.objects
+        return list(self._objects_by_type.get(cls, ()))
 
     def get_object_by_name(self, name: str): 
         # looking at the player inventory first:
@@ -173,16 +417,16 @@ class GridPuzzle:
     # ACTIONS # 
     def equip(self, obj_name: str): 
         obj = self.get_object_by_name(obj_name)
+        if obj and not obj.carryable:
+            return f"The {obj_name} cannot be picked up."
         if obj: 
-            for o in self.get_objects_at(self.player.position): 
-                if isinstance(o, Button):
-                    o.remove_weight(getattr(obj, 'weight', 0))
+            self.emit("pick_up", self.player.position, obj)
 
             if self.player.inventory:
                 return "Your hands are full! Drop what you're carrying first."
 
             self.player.inventory = obj
-            self.objects.remove(obj)
+            self._remove_object(obj)
 
             return f"You now have the item {obj_name} in your inventory."
         else: 
@@ -196,13 +440,11 @@ class GridPuzzle:
         if self.player.inventory.__class__.__name__.lower() != obj_name.lower():
             return f"You aren't carrying a {obj_name}."
         
-        for o in self.get_objects_at(self.player.position): 
-            if isinstance(o, Button):
-                o.add_weight(getattr(obj, 'weight', 0))
+        self.emit("drop", self.player.position, obj)
 
         self.player.inventory = None
         obj.set_position(self.player.position)
-        self.objects.append(obj)
+        self._place_object(obj)
         return f"You have dropped the {obj_name}. It is no longer in your inventory. " 
 
     def move_player(self, direction: str):
@@ -213,22 +455,8 @@ class GridPuzzle:
         return "Invalid move."
         
     def handle_player_movement(self, old_position: Tuple[int, int], new_position: Tuple[int, int]):
-        results = []
-
-        # Handle leaving the old position
-        for obj in self.get_objects_at(old_position):
-            if hasattr(obj, 'on_leave'):
-                result = obj.on_leave(self.player)
-                if result:
-                    results.append(result)
-
-        # Handle entering the new position
-        for obj in self.get_objects_at(new_position):
-            if hasattr(obj, 'on_enter'):
-                result = obj.on_enter(self.player)
-                if result:
-                    results.append(result)
-
+        # leaving the old position first, then entering the new one
+        results = self.emit("leave", old_position, self.player) + self.emit("enter", new_position, self.player)
         return "\n".join(results) if results else f"Moved to {new_position}"
 
     def interact(self, obj):
@@ -236,9 +464,115 @@ class GridPuzzle:
 
     # check result 
     def is_solved(self):
-        door = next((obj for obj in self.objects if isinstance(obj, Door)), None)
+        door = next(iter(self.get_objects_of_type(Door)), None)
         return door and door.open and self.player.position == door.position
 
+    # copies 
+    def clone(self) -> "GridPuzzle":
+        """An independent copy of the puzzle in its current state, without rebuilding the level.
+
+        Objects are copied attribute by attribute, and attributes that refer to other objects of the puzzle
+        (such as linked_objects) are pointed at the copies. Lists are copied so nothing mutable is shared.
+        """
+        puzzle = GridPuzzle.__new__(GridPuzzle)
+        copies: Dict[int, GameObject] = {}
+        new_object = object.__new__
+        for obj in self._entities:
+            copies[id(obj)] = new_object(obj.__class__)
+        get = copies.get
+        set_attribute = object.__setattr__
+        for obj in self._entities:
+            new = copies[id(obj)]
+            for name, value in iter_attributes(obj):
+                if value.__class__ is list:
+                    value = [get(id(v), v) for v in value]
+                else:
+                    value = get(id(value), value)
+                set_attribute(new, name, value)
+            new.puzzle = puzzle
+
+        # tuples shared between the indexes stay shared in the copy
+        remapped: Dict[int, Tuple[GameObject, ...]] = {}
+
+        def remap_cells(cells: Dict) -> Dict:
+            new_cells = {}
+            for key, objs in cells.items():
+                new = remapped.get(id(objs))
+                if new is None:
+                    new = remapped[id(objs)] = tuple([copies[id(obj)] for obj in objs])
+                new_cells[key] = new
+            return new_cells
+
+        puzzle.grid_size = self.grid_size
+        puzzle.player = player = new_object(self.player.__class__)
+        for name, value in iter_attributes(self.player):
+            set_attribute(player, name, get(id(value), value))
+        puzzle.objects = [copies[id(obj)] for obj in self.objects]
+        puzzle.steps = self.steps
+        puzzle._objects_by_position = remap_cells(self._objects_by_position)
+        puzzle._objects_by_type = {cls: [copies[id(obj)] for obj in objs] for cls, objs in self._objects_by_type.items()}
+        puzzle._entities = list(copies.values())
+        puzzle._buttons = [copies[id(obj)] for obj in self._buttons]
+        puzzle._doors = [copies[id(obj)] for obj in self._doors]
+        puzzle._state_format = self._state_format
+        puzzle._listeners = {event: remap_cells(cells) for event, cells in self._listeners.items()}
+        puzzle._signals = deque()
+        puzzle._propagating = False
+        return puzzle
+
+    # snapshots 
+    def _get_state_format(self) -> struct.Struct:
+        if self._state_format is None:
+            # player x/y, inventory id (-1 for none), object x/y pairs, button weights, button pressed flags, door open flags
+            n, b, d = len(self._entities), len(self._buttons), len(self._doors)
+            self._state_format = struct.Struct(f"<HHh{2 * n}H{b}I{b}?{d}?")
+        return self._state_format
+
+    def snapshot(self) -> PuzzleState:
+        # steps are not part of the state, so the same configuration reached by different paths is equal
+        inventory = self.player.inventory
+        values = [*self.player.position, self._entities.index(inventory) if inventory is not None else -1]
+        for obj in self._entities:
+            values.extend(obj.position)
+        values.extend(button.current_weight for button in self._buttons)
+        values.extend(button.pressed for button in self._buttons)
+        values.extend(door.open for door in self._doors)
+        return self._get_state_format().pack(*values)
+
+    def restore(self, state: PuzzleState):
+        values = self._get_state_format().unpack(state)
+        n, b = len(self._entities), len(self._buttons)
+        self.player.position = (values[0], values[1])
+
+        # only objects that differ from the current state are touched, so nearby states restore quickly
+        inventory = self._entities[values[2]] if values[2] >= 0 else None
+        if inventory is not self.player.inventory:
+            if inventory is not None:
+                self._remove_object(inventory)
+            held, self.player.inventory = self.player.inventory, inventory
+            if held is not None:
+                i = self._entities.index(held)
+                held.position = (values[3 + 2 * i], values[4 + 2 * i])
+                self._place_object(held)
+
+        for i, obj in enumerate(self._entities):
+            position = (values[3 + 2 * i], values[4 + 2 * i])
+            if obj.position != position:
+                if obj is not inventory:
+                    self._remove_from_cell(obj, obj.position)
+                    self._add_to_cell(obj, position)
+                obj.position = position
+
+        offset = 3 + 2 * n
+        for i, button in enumerate(self._buttons):
+            button.current_weight = values[offset + i]
+            button.pressed = values[offset + b + i]
+        offset += 2 * b
+        for i, door in enumerate(self._doors):
+            door.open = values[offset + i]
+
     def get_status(self):
-        return f"Player at {self.player.position}, Steps: {self.steps}, Inventory: {self.player.inventory}"
+        # the item name rather than the object repr, which includes a memory address and would make prompts differ between runs
+        inventory = self.player.inventory.__class__.__name__.lower() if self.player.inventory else None
+        return f"Player at {self.player.position}, Steps: {self.steps}, Inventory: {inventory}"
     
\ No newline at end of file
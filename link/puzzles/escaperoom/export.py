@@ -0,0 +1,210 @@
+import csv
+import importlib.util
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from link.puzzles.escaperoom.metrics import aggregate
+from link.puzzles.escaperoom.replay import _has_turns, get_level, read_episodes, replay_episode
+import link.puzzles.escaperoom.levels as levels
+
+# column -> type, so every batch of a file has the same schema even when a batch only has None in a column
+EPISODE_COLUMNS: Dict[str, type] = {
+    'model': str, 'puzzle_level': str, 'seed': int,
+    'total_steps': int, 'is_solved': bool, 'num_iterations': int, 'optimal_steps': int, 'efficiency': float,
+    'invalid_actions': int, 'termination_reason': str, 'prompt_mode': str, 'total_prompt_tokens': int, 'baseline_prompt_tokens': int,
+    'wall_time': float, 'time_to_solve': float, 'time_to_first_action': float, 'stopped_streams': int, 'llm_latency_p50': float, 'llm_latency_p95': float,
+    'total_input_tokens': int, 'total_output_tokens': int, 'total_tokens': int,
+    'total_cached_input_tokens': int, 'prompt_cache_hit_rate': float, 'cache_hits': int, 'cache_misses': int,
+}
+
+STEP_COLUMNS: Dict[str, type] = {
+    'model': str, 'puzzle_level': str, 'seed': int,
+    'turn': int, 'action': str, 'valid': bool, 'result': str, 'x': int, 'y': int, 'inventory': str,
+    'buttons_pressed': str, 'doors_open': str, 'steps': int, 'solved': bool, 'llm_latency': float,
+}
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+
+def has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _arrow_schema(columns: Dict[str, type]):
+    import pyarrow as pa
+    types = {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}
+    return pa.schema([(name, types[kind]) for name, kind in columns.items()])
+
+
+def _convert(value: Any, kind: type) -> Any:
+    if value is None or value == '':
+        return None
+    if kind is bool:
+        return value if isinstance(value, bool) else value == 'True'
+    return kind(value)
+
+
+class ColumnWriter:
+    """Writes rows in batches of `batch_size`, so memory does not grow with the number of rows."""
+
+    def __init__(self, path: Path, columns: Dict[str, type], format: str, batch_size: int = 10000):
+        self.path = Path(path)
+        self.columns = columns
+        self.format = format
+        self.batch_size = batch_size
+        self.rows: List[Dict[str, Any]] = []
+        self.rows_written = 0
+        if format == "csv":
+            self._file = open(self.path, 'w', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=list(columns), extrasaction='ignore')
+            self._writer.writeheader()
+        else:
+            import pyarrow as pa
+            self._schema = _arrow_schema(columns)
+            if format == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._file = pa.OSFile(str(self.path), 'wb')
+                self._writer = pa.ipc.new_file(self._file, self._schema)
+
+    def write(self, row: Dict[str, Any]):
+        self.rows.append({name: _convert(row.get(name), kind) for name, kind in self.columns.items()})
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.format == "csv":
+            self._writer.writerows(self.rows)
+        else:
+            import pyarrow as pa
+            batch = pa.RecordBatch.from_pylist(self.rows, schema=self._schema)
+            if self.format == "parquet":
+                self._writer.write_batch(batch)
+            else:
+                self._writer.write(batch)
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.format != "csv":
+            self._writer.close()
+        if self.format != "parquet":
+            self._file.close()
+
+    def __enter__(self) -> 'ColumnWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_step_rows(result: Dict[str, Any], replayed: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    # replayed steps are the executed actions in order, which are also the turns with an action
+    turns = [turn for turn in result.get('turns') or [] if 'action' in turn]
+    for i, step in enumerate(replayed['trace']):
+        turn = turns[i] if i < len(turns) else {}
+        yield {
+            'model': result.get('model'),
+            'puzzle_level': result['puzzle_level'],
+            'seed': result.get('seed', 0),
+            'turn': turn.get('turn', i),
+            'action': step['action'],
+            'valid': step['valid'],
+            'result': step['result'],
+            'x': step['player'][0],
+            'y': step['player'][1],
+            'inventory': step['inventory'],
+            'buttons_pressed': step['buttons_pressed'],
+            'doors_open': step['doors_open'],
+            'steps': step['steps'],
+            'solved': step['solved'],
+            'llm_latency': turn.get('llm_latency'),
+        }
+
+
+def export_results(path: str, output_dir: str, format: Optional[str] = None, steps: bool = True, batch_size: int = 10000,
+                   level_factory: Callable[[Any], levels.BaseLevel] = get_level) -> Dict[str, Any]:
+    """Writes per-episode summaries to `<output_dir>/episodes<ext>` and, with steps=True, per-step traces to `steps<ext>`.
+
+    Steps are rebuilt by replaying each episode's actions, with the latency of the turn that chose each action.
+    Episodes are streamed one at a time and conversations are only read for results without recorded turns.
+    format is "parquet", "arrow" (IPC file) or "csv"; by default parquet if pyarrow is installed, otherwise csv.
+    """
+    if format is None:
+        format = "parquet" if has_pyarrow() else "csv"
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format}. Choose from {list(FORMATS)}")
+    if format != "csv" and not has_pyarrow():
+        raise ImportError(f"Writing {format} needs pyarrow; use format='csv' or install pyarrow")
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    episodes_path = output / f"episodes{FORMATS[format]}"
+    steps_path = output / f"steps{FORMATS[format]}"
+
+    episodes = ColumnWriter(episodes_path, EPISODE_COLUMNS, format, batch_size)
+    step_writer = ColumnWriter(steps_path, STEP_COLUMNS, format, batch_size) if steps else None
+    try:
+        for result in read_episodes(Path(path), conversations=not _has_turns(Path(path))):
+            row = dict(result)
+            if step_writer:
+                replayed = replay_episode(result, trace=True, level_factory=level_factory)
+                row['invalid_actions'] = replayed['invalid_actions']
+                for step in get_step_rows(result, replayed):
+                    step_writer.write(step)
+            episodes.write(row)
+    finally:
+        episodes.close()
+        if step_writer:
+            step_writer.close()
+
+    written = {'format': format, 'episodes': episodes.rows_written, 'episodes_path': str(episodes_path)}
+    if step_writer:
+        written.update({'steps': step_writer.rows_written, 'steps_path': str(steps_path)})
+    print(f"Exported {episodes.rows_written} episodes" + (f" and {step_writer.rows_written} steps" if step_writer else "")
+          + f" to {output} ({format})")
+    return written
+
+
+def read_columns(path: str, columns: Optional[Sequence[str]] = None, batch_size: int = 10000) -> Iterator[Dict[str, Any]]:
+    """Rows of an exported file as dicts, reading only `columns` and one batch at a time."""
+    path = Path(path)
+    if path.suffix == ".csv":
+        types = {**STEP_COLUMNS, **EPISODE_COLUMNS}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                yield {name: _convert(row[name], types.get(name, str)) for name in (columns or row.keys())}
+    elif path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+            yield from batch.to_pylist()
+    elif path.suffix == ".arrow":
+        import pyarrow as pa
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                yield from (batch.select(columns) if columns else batch).to_pylist()
+    else:
+        raise ValueError(f"Unknown export file {path}. Expected one of {list(FORMATS.values())}")
+
+
+def summarize(path: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Solve rate with its confidence interval and the steps distribution per (model, level) of an exported episodes file."""
+    rows = read_columns(path, columns=['model', 'puzzle_level', 'is_solved', 'total_steps', 'efficiency'])
+    stats = {key: pair_stats.summary() for key, pair_stats in aggregate(rows).items()}
+    for (model, level), summary in stats.items():
+        print(f"{model} level {level}: solved {summary['solved']}/{summary['episodes']} ({summary['solve_rate']:.0%}), "
+              f"steps {summary['steps_histogram']}")
+    return stats
+
+
+if __name__ == '__main__':
+    import fire
+    fire.Fire({
+        "export": export_results,
+        "summarize": summarize,
+    })
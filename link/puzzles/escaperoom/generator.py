@@ -0,0 +1,185 @@
+import json
+import random
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from link.puzzles.escaperoom.entities import GridPuzzle, Door, Button, Rock
+from link.puzzles.escaperoom.levels import BaseLevel
+from link.puzzles.escaperoom.solver import solve
+
+BUTTON_THRESHOLDS = [50, 90, 150, 200]
+
+
+@dataclass
+class LevelSpec:
+    # plain data so levels can be written to and read from a corpus file
+    seed: int
+    grid_size: Tuple[int, int]
+    player_start: Tuple[int, int]
+    doors: List[Tuple[int, int]]
+    # (position, weight threshold, indexes of the doors it opens)
+    buttons: List[Tuple[Tuple[int, int], int, List[int]]]
+    rocks: List[Tuple[int, int]]
+    optimal_steps: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LevelSpec':
+        return cls(
+            seed=data['seed'],
+            grid_size=tuple(data['grid_size']),
+            player_start=tuple(data['player_start']),
+            doors=[tuple(door) for door in data['doors']],
+            buttons=[(tuple(position), threshold, list(links)) for position, threshold, links in data['buttons']],
+            rocks=[tuple(rock) for rock in data['rocks']],
+            optimal_steps=data.get('optimal_steps'),
+        )
+
+    def key(self) -> str:
+        # identifies the layout regardless of the seed that produced it
+        return json.dumps([self.grid_size, self.player_start, self.doors, self.buttons, self.rocks])
+
+
+class GeneratedLevel(BaseLevel):
+    def __init__(self, spec: LevelSpec):
+        self.spec = spec
+        super().__init__()
+
+    def _setup_puzzle(self):
+        self.puzzle = GridPuzzle(self.spec.grid_size)
+        self.puzzle.player.position = self.spec.player_start
+
+        # the first door is the exit (GridPuzzle.is_solved checks it), any others are decoys
+        doors = [Door(position) for position in self.spec.doors]
+        for door in doors:
+            self.puzzle.add_object(door)
+        for position, threshold, links in self.spec.buttons:
+            self.puzzle.add_object(Button(position, [doors[i] for i in links], weight_threshold=threshold))
+        for position in self.spec.rocks:
+            self.puzzle.add_object(Rock(position))
+
+    def _setup_actions(self):
+        self.available_actions = {
+            "puzzle.get_status()": "Shows position, inventory items, and steps",
+            "puzzle.is_solved()": "Checks if puzzle is solved",
+            "puzzle.move_player('up')": "Move up one space",
+            "puzzle.move_player('down')": "Move down one space",
+            "puzzle.move_player('left')": "Move left one space",
+            "puzzle.move_player('right')": "Move right one space",
+            "puzzle.equip('rock')": "Pick up rock if at same position",
+            "puzzle.drop('rock')": "Drop currently held rock"
+        }
+
+
+def check_counts(grid_size: Tuple[int, int], num_doors: int, num_buttons: int, num_rocks: int):
+    # the player and every object need a cell of their own, the first door is the exit and only a button opens it
+    if num_doors < 1 or num_buttons < 1 or num_rocks < 0:
+        raise ValueError(f"Need at least one door and one button and no negative counts, got {num_doors} doors, "
+                         f"{num_buttons} buttons, {num_rocks} rocks")
+    cells = grid_size[0] * grid_size[1]
+    if 1 + num_doors + num_buttons + num_rocks > cells:
+        raise ValueError(f"A {grid_size[0]}x{grid_size[1]} grid has {cells} cells, too few for the player, "
+                         f"{num_doors} doors, {num_buttons} buttons and {num_rocks} rocks")
+
+
+def random_spec(rng: random.Random, seed: int, grid_size: Tuple[int, int], num_doors: int, num_buttons: int,
+                num_rocks: int, link_probability: float) -> LevelSpec:
+    width, height = grid_size
+    # sample distinct cells without building the whole grid, which matters for large grids
+    cells = set()
+    while len(cells) < 1 + num_doors + num_buttons + num_rocks:
+        cells.add((rng.randrange(width), rng.randrange(height)))
+    cells = list(cells)
+    rng.shuffle(cells)
+
+    player_start, cells = cells[0], cells[1:]
+    doors, cells = cells[:num_doors], cells[num_doors:]
+    buttons = []
+    for i, position in enumerate(cells[:num_buttons]):
+        links = [d for d in range(num_doors) if rng.random() < link_probability]
+        if i == 0 and 0 not in links:
+            # at least one button has to open the exit
+            links.insert(0, 0)
+        buttons.append((position, rng.choice(BUTTON_THRESHOLDS), links))
+    rocks = cells[num_buttons:]
+
+    return LevelSpec(seed=seed, grid_size=grid_size, player_start=player_start, doors=doors, buttons=buttons, rocks=rocks)
+
+
+def generate_level(seed: int, grid_size: Tuple[int, int] = (8, 8), num_doors: int = 1, num_buttons: int = 2, num_rocks: int = 2,
+                   link_probability: float = 0.5, max_states: int = 20000, max_attempts: int = 100) -> Tuple[Optional[GeneratedLevel], int]:
+    """Generates a solvable level from a seed, returning it with the number of rejected attempts.
+
+    A candidate is rejected if the solver cannot solve it within max_states or if it is already solved.
+    """
+    check_counts(grid_size, num_doors, num_buttons, num_rocks)
+    rng = random.Random(seed)
+    for attempt in range(max_attempts):
+        spec = random_spec(rng, seed, tuple(grid_size), num_doors, num_buttons, num_rocks, link_probability)
+        level = GeneratedLevel(spec)
+        solution = solve(level.puzzle, max_states=max_states)
+        if solution is not None and solution.steps > 0:
+            spec.optimal_steps = solution.steps
+            return level, attempt
+    return None, max_attempts
+
+
+def generate_corpus(path: str, count: int = 1000, seed: int = 0, grid_size: Tuple[int, int] = (8, 8), num_doors: int = 1,
+                    num_buttons: int = 2, num_rocks: int = 2, link_probability: float = 0.5, max_states: int = 20000,
+                    max_seeds: Optional[int] = None) -> Dict[str, float]:
+    """Writes `count` distinct solvable levels to a JSONL corpus and reports throughput and rejection rate.
+
+    Tries at most max_seeds seeds (by default 10 per level), so a grid too small for `count` distinct levels
+    ends with fewer levels instead of running forever.
+    """
+    check_counts(grid_size, num_doors, num_buttons, num_rocks)
+    if max_seeds is None:
+        max_seeds = 10 * count
+    start = time.perf_counter()
+    seen = set()
+    rejected, duplicates, level_seed = 0, 0, seed
+
+    with open(path, 'w') as f:
+        while len(seen) < count and level_seed < seed + max_seeds:
+            level, attempts = generate_level(level_seed, grid_size, num_doors, num_buttons, num_rocks, link_probability, max_states)
+            level_seed += 1
+            rejected += attempts
+            if level is None:
+                continue
+            key = level.spec.key()
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            f.write(json.dumps(level.spec.to_dict()) + "\n")
+
+    elapsed = time.perf_counter() - start
+    if len(seen) < count:
+        print(f"Only found {len(seen)} of {count} distinct solvable levels in {max_seeds} seeds")
+    candidates = max(1, len(seen) + rejected + duplicates)
+    stats = {
+        "levels": len(seen),
+        "seconds": elapsed,
+        "levels_per_minute": len(seen) / elapsed * 60 if elapsed else 0.0,
+        "rejection_rate": (rejected + duplicates) / candidates,
+        "unsolvable_rejections": rejected,
+        "duplicate_rejections": duplicates,
+    }
+    print(f"Wrote {stats['levels']} levels to {path} in {elapsed:.1f}s ({stats['levels_per_minute']:.0f}/min), "
+          f"rejection rate {stats['rejection_rate']:.1%}")
+    return stats
+
+
+def load_corpus(path: str) -> Iterator[GeneratedLevel]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield GeneratedLevel(LevelSpec.from_dict(json.loads(line)))
+
+
+if __name__ == '__main__':
+    import fire
+    fire.Fire(generate_corpus)
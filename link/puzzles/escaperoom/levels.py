@@ -1,7 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Tuple, List
+from typing import Callable, Dict, Optional, Set, Tuple, List, Union
+import importlib
+import threading
 from link.puzzles.escaperoom.entities import GridPuzzle, Door, Button, Rock
 
+# the registry helpers (register_level, list_levels) are used through the module, not star-imported
+__all__ = ["BaseLevel", "LevelOne", "LevelTwo", "get_level"]
+
 class BaseLevel(ABC):
     def __init__(self):
         self.puzzle: GridPuzzle = None
@@ -28,6 +33,13 @@ class BaseLevel(ABC):
     def validate_solution(self) -> bool:
         return self.puzzle.is_solved()
 
+    def clone(self) -> 'BaseLevel':
+        # same level with its own copy of the puzzle; the rest (actions, prerequisites, specs) is shared and read-only
+        level = object.__new__(self.__class__)
+        level.__dict__ = dict(self.__dict__)
+        level.puzzle = self.puzzle.clone()
+        return level
+
 class LevelOne(BaseLevel):
     def __init__(self):
         super().__init__()
@@ -74,6 +86,7 @@ class LevelTwo(BaseLevel):
         puzzle.add_object(button1)
         puzzle.add_object(button2)
         puzzle.add_object(rock1)
+        self.puzzle = puzzle
 
     def _setup_actions(self):
         self.available_actions = {
@@ -89,12 +102,80 @@ class LevelTwo(BaseLevel):
 
 
 
-def get_level(level_number: int) -> BaseLevel:
-    levels = {
-        1: LevelOne,
-        2: LevelTwo
-    }
-
-    if level_number not in levels:
-        raise ValueError(f"Level {level_number} does not exist. ")
-    return levels[level_number]()
\ No newline at end of file
+# level name -> level class (or any callable returning a BaseLevel), or a "module:attribute" string
+# imported the first time the level is used. Packages can add levels through the entry point group below.
+LevelFactory = Callable[[], BaseLevel]
+ENTRY_POINT_GROUP = "link.escaperoom.levels"
+_registry: Dict[str, Union[LevelFactory, str]] = {}
+# names of levels that are built once and cloned, and the built templates; templates are never played
+_cached_templates: Set[str] = set()
+_templates: Dict[str, BaseLevel] = {}
+_registry_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+def register_level(name: Union[int, str], factory: Optional[Union[LevelFactory, str]] = None, cache_template: bool = False):
+    """Registers a level under `name`. Also works as a class decorator: @register_level("three").
+
+    With cache_template=True the level is built once and get_level returns clones of it. That pays off for
+    levels that are expensive to build (loaded from disk, searched for, ...); small hand-written levels such
+    as LevelOne are built faster than they are cloned.
+    """
+    def register(factory: Union[LevelFactory, str]):
+        with _registry_lock:
+            _registry[str(name)] = factory
+            _templates.pop(str(name), None)
+            if cache_template:
+                _cached_templates.add(str(name))
+            else:
+                _cached_templates.discard(str(name))
+        return factory
+    return register(factory) if factory is not None else register
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if not _entry_points_loaded:
+        _entry_points_loaded = True
+        # importlib.metadata is slow to import, so only when a name is not registered in code
+        import importlib.metadata
+        for entry_point in importlib.metadata.entry_points(group=ENTRY_POINT_GROUP):
+            # levels registered in code take precedence over plugins of the same name
+            _registry.setdefault(entry_point.name, entry_point.value)
+
+
+def _get_factory(name: str) -> LevelFactory:
+    if name not in _registry:
+        _load_entry_points()
+    if name not in _registry:
+        raise ValueError(f"Level {name} does not exist. ")
+    factory = _registry[name]
+    if isinstance(factory, str):
+        module, _, attribute = factory.partition(":")
+        factory = _registry[name] = getattr(importlib.import_module(module), attribute)
+    return factory
+
+
+def list_levels() -> List[str]:
+    with _registry_lock:
+        _load_entry_points()
+        return list(_registry)
+
+
+def get_level(level_number: Union[int, str]) -> BaseLevel:
+    name = str(level_number)
+    factory = _registry.get(name)
+    if factory is not None and not isinstance(factory, str) and name not in _cached_templates:
+        return factory()
+    with _registry_lock:
+        factory = _get_factory(name)
+        if name not in _cached_templates:
+            return factory()
+        template = _templates.get(name)
+        if template is None:
+            template = _templates[name] = factory()
+    return template.clone()
+
+
+register_level(1, LevelOne)
+register_level(2, LevelTwo)
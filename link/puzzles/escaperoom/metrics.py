@@ -0,0 +1,147 @@
+import math
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# called with ("turn", turn_metrics) after every action and ("episode", episode_metrics) at the end of run_eval
+MetricsCallback = Callable[[str, Dict[str, Any]], None]
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    # nearest-rank percentile, q in [0, 100]
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def get_usage(response: Any) -> Dict[str, Optional[int]]:
+    # OpenAI-style usage; providers that do not report it give None
+    usage = getattr(response, "usage", None)
+    input_tokens = getattr(usage, "prompt_tokens", None)
+    output_tokens = getattr(usage, "completion_tokens", None)
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    if input_tokens is None and getattr(usage, "input_tokens", None) is not None:
+        # Anthropic-style usage counts cache reads and writes separately from input_tokens
+        cached_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+        input_tokens = usage.input_tokens + cached_tokens + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+        output_tokens = getattr(usage, "output_tokens", None)
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        # the part of input_tokens served from the provider's prompt cache
+        "cached_input_tokens": cached_tokens,
+    }
+
+
+def _total(turns: List[Dict[str, Any]], key: str) -> Optional[float]:
+    values = [turn[key] for turn in turns if turn.get(key) is not None]
+    return sum(values) if values else None
+
+
+def summarize_turns(turns: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies = [turn["llm_latency"] for turn in turns if not turn.get("cached")]
+    input_tokens, output_tokens = _total(turns, "input_tokens"), _total(turns, "output_tokens")
+    total_tokens = None if input_tokens is None and output_tokens is None else (input_tokens or 0) + (output_tokens or 0)
+    cached_tokens = _total(turns, "cached_input_tokens")
+    # over the turns that report both, so providers without cache reporting do not dilute the rate
+    reported = [turn for turn in turns if turn.get("cached_input_tokens") is not None and turn.get("input_tokens")]
+    cache_hit_rate = (sum(turn["cached_input_tokens"] for turn in reported) / sum(turn["input_tokens"] for turn in reported)
+                      if reported else None)
+    return {
+        "llm_latency_p50": percentile(latencies, 50),
+        "llm_latency_p95": percentile(latencies, 95),
+        "total_llm_time": sum(turn["llm_latency"] for turn in turns),
+        "total_render_time": sum(turn["render_time"] for turn in turns),
+        "total_action_time": sum(turn["action_time"] for turn in turns),
+        "total_input_tokens": input_tokens,
+        "total_output_tokens": output_tokens,
+        "total_tokens": total_tokens,
+        "total_cached_input_tokens": cached_tokens,
+        "prompt_cache_hit_rate": cache_hit_rate,
+        # streamed responses that were cut off after their action line
+        "stopped_streams": sum(1 for turn in turns if turn.get("stream_stopped")),
+    }
+
+
+def wilson_interval(successes: int, n: int, z: float = 1.96) -> Tuple[float, float]:
+    # confidence interval for a success rate; unlike the normal approximation it stays inside [0, 1] for small n
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def _counter_percentile(counts: Counter, q: float) -> Optional[float]:
+    # nearest-rank percentile like percentile(), over value -> count
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank = max(1, math.ceil(q / 100 * total))
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        if seen >= rank:
+            return value
+
+
+EFFICIENCY_BINS = 10
+
+
+class EpisodeStats:
+    """Running aggregate over the episodes of one (model, level) pair.
+
+    Steps are kept as a histogram and efficiency in fixed bins, so memory does not grow with the number of episodes.
+    """
+
+    def __init__(self):
+        self.episodes = 0
+        self.solved = 0
+        # total_steps of solved episodes -> number of episodes
+        self.steps: Counter = Counter()
+        self.efficiency_sum = 0.0
+        self.efficiency_histogram = [0] * EFFICIENCY_BINS
+
+    def add(self, result: Dict[str, Any]):
+        self.episodes += 1
+        if result.get('is_solved'):
+            self.solved += 1
+            self.steps[int(result['total_steps'])] += 1
+        efficiency = result.get('efficiency')
+        if efficiency is not None:
+            self.efficiency_sum += efficiency
+            self.efficiency_histogram[min(max(int(efficiency * EFFICIENCY_BINS), 0), EFFICIENCY_BINS - 1)] += 1
+
+    def is_precise(self, ci_width: float, min_episodes: int = 0) -> bool:
+        low, high = wilson_interval(self.solved, self.episodes)
+        return self.episodes >= max(min_episodes, 1) and high - low <= ci_width
+
+    def summary(self) -> Dict[str, Any]:
+        low, high = wilson_interval(self.solved, self.episodes)
+        efficiencies = sum(self.efficiency_histogram)
+        return {
+            'episodes': self.episodes,
+            'solved': self.solved,
+            'solve_rate': self.solved / self.episodes if self.episodes else None,
+            'solve_rate_low': low,
+            'solve_rate_high': high,
+            'mean_steps': sum(steps * count for steps, count in self.steps.items()) / self.solved if self.solved else None,
+            'median_steps': _counter_percentile(self.steps, 50),
+            'p90_steps': _counter_percentile(self.steps, 90),
+            # total_steps of solved episodes -> number of episodes
+            'steps_histogram': dict(sorted(self.steps.items())),
+            'mean_efficiency': self.efficiency_sum / efficiencies if efficiencies else None,
+            # episode counts for efficiency in [0, 0.1), [0.1, 0.2), ... [0.9, 1.0]
+            'efficiency_histogram': list(self.efficiency_histogram),
+        }
+
+
+def aggregate(results: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str], EpisodeStats]:
+    # (model, puzzle_level) -> stats, streaming over results such as ResultSink.read(conversations=False)
+    stats: Dict[Tuple[str, str], EpisodeStats] = defaultdict(EpisodeStats)
+    for result in results:
+        stats[(result['model'], str(result['puzzle_level']))].add(result)
+    return stats
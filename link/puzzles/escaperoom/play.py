@@ -1,20 +1,32 @@
 from link.puzzles.escaperoom.runner import Runner
+from link.puzzles.escaperoom.scheduler import ProviderRateLimits, run_concurrently
+from link.puzzles.escaperoom.results import ResultSink, open_sink, find_shards, get_shard_path, merge_results, remove_results
+from link.puzzles.escaperoom.cache import ResponseCache
+from link.puzzles.escaperoom.clients import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, get_client_registry
+from link.puzzles.escaperoom.metrics import EpisodeStats, MetricsCallback, aggregate
 
 import csv
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
-import fire 
+from typing import List, Dict, Any, Optional, Tuple, Union
+import threading
+
+_print_lock = threading.Lock()
 
 def write_results_to_csv(results_list: List[Dict], output_dir: Path = Path("results")):
     output_dir.mkdir(exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filepath = output_dir / f"puzzle_results_{timestamp}.csv"
     
-    fieldnames = ['model', 'puzzle_level', 'total_steps', 'is_solved', 'num_iterations', 'conversation']
+    fieldnames = ['model', 'puzzle_level', 'seed', 'total_steps', 'is_solved', 'num_iterations', 'optimal_steps', 'efficiency', 
+                  'prompt_mode', 'total_prompt_tokens', 'baseline_prompt_tokens', 'prompt_tokens', 
+                  'wall_time', 'time_to_solve', 'llm_latency_p50', 'llm_latency_p95', 'total_input_tokens', 'total_output_tokens', 'total_tokens', 
+                  'total_cached_input_tokens', 'prompt_cache_hit_rate', 'termination_reason', 'invalid_actions', 
+                  'time_to_first_action', 'stopped_streams', 'conversation']
     
     with open(filepath, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        # per-turn metrics and other list-valued fields are left to the JSONL/SQLite results
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
         writer.writeheader()
         writer.writerows(results_list)
     
@@ -31,22 +43,197 @@ def pretty_print_messages(messages: List[Dict[str, Any]]) -> None:
         print(f"Content: {content}")
 
 
-def play(models: List[str] = ["openai:gpt-4o", "anthropic:claude-3-5-sonnet-20240620"], puzzles: List[int] = [1], max_iterations:int=30, print_results=False): 
-    all_results = []
+def run_episode(model: str, level: int, max_iterations: int, seed: int = 0, **runner_kwargs) -> Dict:
+    sess = Runner(model=model, puzzle_level=level, seed=seed, **runner_kwargs)
+    results = sess.run_eval(max_iterations=max_iterations)
+    results.update({'model': model, 'puzzle_level': level, 'seed': seed})
+    return results
+
+def _run_jobs(jobs: List[Tuple[str, int, int]], sink: ResultSink, max_iterations: int, print_results: bool, concurrency: int, 
+              requests_per_minute: Optional[Dict[str, float]], ci_width: Optional[float] = None, min_repetitions: int = 0, 
+              **runner_kwargs) -> int:
+    # returns the number of jobs not run because their (model, level) pair was already precise enough
+    rate_limits = ProviderRateLimits(requests_per_minute)
+    # running statistics per (model, level), starting from the episodes already in the sink
+    stats = aggregate(sink.read(conversations=False)) if ci_width is not None else None
+    stats_lock = threading.Lock()
+    stopped = 0
 
-    for model in models: 
-        print(f"Testing {model}... ")
-        for level in puzzles: 
-            sess = Runner(model=model, puzzle_level=level)
-            results = sess.run_eval(max_iterations=max_iterations)
-            results.update({'model': model, 'puzzle_level': level})
-            if print_results: 
+    def run_job(job: Tuple[str, int, int]):
+        nonlocal stopped
+        model, level, seed = job
+        if stats is not None:
+            with stats_lock:
+                if stats[(model, str(level))].is_precise(ci_width, min_repetitions):
+                    stopped += 1
+                    return
+        print(f"Testing {model} on level {level} (seed {seed})... ")
+        results = run_episode(model, level, max_iterations, seed, rate_limiter=rate_limits.get(model), **runner_kwargs)
+        sink.write(results)
+        if stats is not None:
+            with stats_lock:
+                stats[(model, str(level))].add(results)
+        if print_results: 
+            with _print_lock:
                 pretty_print_messages(results['conversation'])
-            all_results.append(results)
-    
-    output_file = write_results_to_csv(all_results)
-    print(f"Results written to {output_file}")
+
+    run_concurrently(jobs, run_job, concurrency=concurrency)
+    return stopped
+
+
+def _run_shard(path: Path, jobs: List[Tuple[str, int, int]], cache_settings: Optional[Dict[str, Any]], client_settings: Dict[str, Any], 
+               **kwargs) -> Tuple[Dict[str, float], int]:
+    # runs in a worker process: its own sink, rate limiters, cache handle and clients, resuming the shard if it already exists
+    get_client_registry().configure(**client_settings)
+    cache = ResponseCache(**cache_settings) if cache_settings else None
+    with open_sink(path) as sink:
+        completed = sink.completed()
+        stopped = _run_jobs([job for job in jobs if (job[0], str(job[1]), job[2]) not in completed], sink, cache=cache, **kwargs)
+    return (cache.stats() if cache else {}), stopped
+
+
+def _run_batch_jobs(jobs: List[Tuple[str, int, int]], sink: ResultSink, max_iterations: int, print_results: bool, directory: Path, 
+                    endpoint: Optional[Any] = None, poll_interval: float = 30.0, ci_width: Optional[float] = None, min_repetitions: int = 0, 
+                    job_timeout: Optional[float] = None, **runner_kwargs):
+    # one lockstep run per model, since provider batch jobs hold requests for a single model
+    from link.puzzles.escaperoom.batch_api import BatchOnlyClient, make_batch_endpoint, run_batched
+    for model in dict.fromkeys(job[0] for job in jobs):
+        episodes = {f"level{level}-seed{seed}": (level, seed) for job_model, level, seed in jobs if job_model == model}
+        print(f"Testing {model} on {len(episodes)} episodes in batch mode... ")
+        client = None if model.startswith("local:") else BatchOnlyClient()
+        runners = {key: Runner(model=model, puzzle_level=level, client=client, seed=seed, **runner_kwargs) for key, (level, seed) in episodes.items()}
+
+        def write(key: str, results: Dict[str, Any], model: str = model):
+            level, seed = episodes[key]
+            results.update({'model': model, 'puzzle_level': level, 'seed': seed})
+            sink.write(results)
+            if print_results:
+                with _print_lock:
+                    pretty_print_messages(results['conversation'])
+
+        model_dir = directory / model.replace(":", "_").replace("/", "_")
+        run_batched(runners, endpoint or make_batch_endpoint(model, model_dir, runners), model_dir, max_iterations=max_iterations, 
+                    poll_interval=poll_interval, max_retries=runner_kwargs.get("max_retries", 3), job_timeout=job_timeout, on_finish=write)
+
+
+def print_stats(stats: Dict[Tuple[str, str], EpisodeStats]):
+    for (model, level), pair_stats in stats.items():
+        summary = pair_stats.summary()
+        line = (f"{model} level {level}: solved {summary['solved']}/{summary['episodes']} "
+                f"({summary['solve_rate']:.0%}, 95% CI {summary['solve_rate_low']:.0%}-{summary['solve_rate_high']:.0%})")
+        if summary['solved']:
+            line += f", steps mean {summary['mean_steps']:.1f} median {summary['median_steps']}"
+        if summary['mean_efficiency'] is not None:
+            line += f", efficiency mean {summary['mean_efficiency']:.2f}"
+        print(line)
+
+
+def play(models: List[str] = ["openai:gpt-4o", "anthropic:claude-3-5-sonnet-20240620"], puzzles: List[int] = [1], max_iterations:int=30, print_results=False, 
+         concurrency: int = 1, requests_per_minute: Optional[Dict[str, float]] = None, max_retries: int = 3, 
+         prompt_mode: str = "full", history_window: Optional[int] = None, seeds: List[int] = [0], output: Optional[str] = None, 
+         cache_dir: Optional[str] = None, cache_mode: str = "readwrite", cache_max_mb: int = 512, 
+         metrics_callback: Optional[MetricsCallback] = None, processes: int = 1, repetitions: Optional[int] = None, 
+         ci_width: Optional[float] = None, min_repetitions: int = 10, temperature: float = 0.5, 
+         prompt_cache: Union[bool, List[str]] = False, max_invalid_actions: Optional[int] = None, 
+         max_state_visits: Optional[int] = None, max_no_progress: Optional[int] = None, 
+         client_pool_size: Optional[int] = None, client_timeout: float = DEFAULT_TIMEOUT, stream: bool = False, 
+         batch: bool = False, batch_endpoint: Optional[Any] = None, batch_dir: Optional[str] = None, poll_interval: float = 30.0, 
+         batch_timeout: Optional[float] = 25 * 3600.0): 
+    # requests_per_minute is keyed by provider, e.g. {"openai": 500, "anthropic": 50}
+    # seeds label repeated episodes of the same (model, level) pair; repetitions=N is shorthand for seeds=range(N)
+    # ci_width stops running a pair once the 95% confidence interval of its solve rate is at most that wide 
+    # (after at least min_repetitions episodes); with processes > 1 each worker decides on its own episodes
+    # output is a .jsonl or .db/.sqlite file; episodes already recorded in it are skipped
+    # cache_dir enables the response cache; cache_mode="replay" runs entirely from it without network
+    # processes > 1 shards the episodes across worker processes, each running `concurrency` episodes at a time; 
+    # the per-provider request limits are split evenly between them and metrics_callback must be picklable
+    # prompt_cache=True (or a list of providers, e.g. ["anthropic"]) adds prompt cache markers for providers that need them
+    # max_invalid_actions, max_state_visits and max_no_progress end hopeless episodes before max_iterations (see Runner)
+    # provider clients and their connections are shared by all episodes of a process; client_pool_size is the number of 
+    # keep-alive connections per provider (by default enough for `concurrency`) and client_timeout the per-request timeout
+    # stream=True reads responses as they are generated and executes the first line that is an action, dropping the rest
+    # batch=True plays all episodes of a model in lockstep, sending each turn's requests as one batch job (OpenAI batch 
+    # format) to batch_endpoint, by default OpenAI's batch API or, for local: models, a file-based stand-in. Request files 
+    # and jobs go to batch_dir (next to output by default); ci_width, processes and concurrency do not apply. A job still 
+    # unfinished after batch_timeout seconds raises TimeoutError
+    cache_settings = {"directory": cache_dir, "mode": cache_mode, "max_bytes": cache_max_mb * 1024 * 1024} if cache_dir else None
+    client_settings = {"pool_size": client_pool_size or max(concurrency, DEFAULT_POOL_SIZE), "timeout": client_timeout}
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = Path(output) if output else Path("results") / f"puzzle_results_{timestamp}.jsonl"
+    job_kwargs = dict(max_retries=max_retries, prompt_mode=prompt_mode, history_window=history_window, metrics_callback=metrics_callback, 
+                         temperature=temperature, ci_width=ci_width, min_repetitions=min_repetitions, prompt_cache=prompt_cache, 
+                         max_invalid_actions=max_invalid_actions, max_state_visits=max_state_visits, max_no_progress=max_no_progress, stream=stream)
+    if repetitions is not None:
+        seeds = list(range(repetitions))
+    cache_stats = []
+    stopped = 0
+
+    with open_sink(output_path) as sink:
+        # shards left behind by an interrupted multi-process run
+        leftover = find_shards(output_path)
+        if leftover:
+            written, duplicates = merge_results(leftover, sink)
+            print(f"Merged {written} episodes from {len(leftover)} unfinished shards ({duplicates} duplicates skipped)")
+            for path in leftover:
+                remove_results(path)
+
+        completed = sink.completed()
+        # seed by seed, so every pair gets its repetitions at the same pace and early stopping can kick in for each
+        jobs: List[Tuple[str, int, int]] = [
+            (model, level, seed) for seed in seeds for model in models for level in puzzles 
+            if (model, str(level), seed) not in completed
+        ]
+        skipped = len(models) * len(puzzles) * len(seeds) - len(jobs)
+        if skipped:
+            print(f"Skipping {skipped} episodes already recorded in {output_path}")
+
+        if batch and jobs:
+            cache = ResponseCache(**cache_settings) if cache_settings else None
+            directory = Path(batch_dir) if batch_dir else output_path.parent / f"{output_path.stem}.batches"
+            _run_batch_jobs(jobs, sink, max_iterations, print_results, directory, batch_endpoint, poll_interval, 
+                            job_timeout=batch_timeout, cache=cache, **job_kwargs)
+            if cache:
+                cache_stats.append(cache.stats())
+        elif processes <= 1 or not jobs:
+            get_client_registry().configure(**client_settings)
+            cache = ResponseCache(**cache_settings) if cache_settings else None
+            stopped = _run_jobs(jobs, sink, max_iterations, print_results, concurrency, requests_per_minute, cache=cache, **job_kwargs)
+            if cache:
+                cache_stats.append(cache.stats())
+        else:
+            # only needed for multi-process runs, and slow to import
+            from concurrent.futures import ProcessPoolExecutor
+            shard_rpm = {provider: limit / processes for provider, limit in requests_per_minute.items()} if requests_per_minute else None
+            # round robin so every shard gets a similar mix of models and levels
+            shards = [(get_shard_path(output_path, i), jobs[i::processes]) for i in range(processes) if jobs[i::processes]]
+            with ProcessPoolExecutor(max_workers=len(shards) or 1) as pool:
+                futures = [
+                    pool.submit(_run_shard, path, shard_jobs, cache_settings, client_settings, max_iterations=max_iterations, print_results=print_results, 
+                                concurrency=concurrency, requests_per_minute=shard_rpm, **job_kwargs) 
+                    for path, shard_jobs in shards
+                ]
+                cache_stats, shard_stopped = zip(*[future.result() for future in futures])
+                stopped = sum(shard_stopped)
+            paths = [path for path, _ in shards]
+            written, duplicates = merge_results(paths, sink)
+            for path in paths:
+                remove_results(path)
+            print(f"Merged {written} episodes from {len(paths)} shards ({duplicates} duplicates skipped)")
+
+        if stopped:
+            print(f"Stopped early: {stopped} episodes were not needed for a {ci_width:.0%} wide confidence interval")
+        pairs = {(model, str(level)) for model in models for level in puzzles}
+        print_stats(aggregate(result for result in sink.read(conversations=False) if (result['model'], str(result['puzzle_level'])) in pairs))
+
+    print(f"Results written to {output_path}")
+    cache_stats = [stats for stats in cache_stats if stats]
+    if cache_stats:
+        hits, misses = sum(s['hits'] for s in cache_stats), sum(s['misses'] for s in cache_stats)
+        hit_rate = hits / (hits + misses) if hits + misses else 0.0
+        print(f"Response cache: {hits} hits, {misses} misses ({hit_rate:.0%} hit rate)")
     return 
 
 if __name__ == '__main__': 
+    # the CLI dependency is not needed to import play() as a library
+    import fire 
     fire.Fire(play)
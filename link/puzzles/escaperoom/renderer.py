@@ -0,0 +1,90 @@
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from link.puzzles.escaperoom.entities import GridPuzzle, GameObject, Door, Button, Rock
+
+LEGEND = "Legend: P=Player, d=Closed Door, D=Open Door, b=Unpressed Button, B=Pressed Button, R=Rock"
+
+# per object type: the grid character and the lines listed under "Objects in puzzle:"
+CellRenderer = Callable[[GameObject], str]
+ObjectRenderer = Callable[[GameObject], List[str]]
+_renderers: Dict[type, Tuple[CellRenderer, ObjectRenderer]] = {}
+_lookup_cache: Dict[type, Optional[Tuple[CellRenderer, ObjectRenderer]]] = {}
+
+
+def register_renderer(cls: Type[GameObject], cell: CellRenderer, describe: ObjectRenderer):
+    _renderers[cls] = (cell, describe)
+    _lookup_cache.clear()
+
+
+register_renderer(Door, lambda obj: 'D' if obj.open else 'd',
+                  lambda obj: [f"- Door at {obj.position}: {'Open' if obj.open else 'Closed'}"])
+register_renderer(Button, lambda obj: 'B' if obj.pressed else 'b',
+                  lambda obj: [f"- Button at {obj.position}: {'Pressed' if obj.pressed else 'Unpressed'}",
+                               f"  Weight threshold: {obj.weight_threshold}"])
+register_renderer(Rock, lambda obj: 'R',
+                  lambda obj: [f"- Rock at {obj.position}: Weight={obj.weight}"])
+
+
+def get_renderer(cls: type) -> Optional[Tuple[CellRenderer, ObjectRenderer]]:
+    # subclasses render like their closest registered base class; unregistered types are not drawn
+    if cls not in _lookup_cache:
+        _lookup_cache[cls] = next((_renderers[base] for base in cls.__mro__ if base in _renderers), None)
+    return _lookup_cache[cls]
+
+
+class GridRenderer:
+    """Renders the same text as utils.print_puzzle_state/print_object_state/print_player_state.
+
+    The grid is kept as one bytearray per row between renders, and only cells whose character changed
+    since the last render are rewritten, so the cost follows the number of objects rather than the grid area.
+    """
+
+    def __init__(self, puzzle: GridPuzzle):
+        self.puzzle = puzzle
+        width, height = puzzle.grid_size
+        self.rows = [bytearray(b' '.join([b'.'] * width)) for _ in range(height)]
+        self.row_text = [row.decode() for row in self.rows]
+        self.cells: Dict[Tuple[int, int], str] = {}
+        self.object_lines: List[str] = []
+
+    def _get_cells(self) -> Dict[Tuple[int, int], str]:
+        cells = {}
+        for obj in self.puzzle.objects:
+            renderer = get_renderer(type(obj))
+            if renderer:
+                cells[obj.position] = renderer[0](obj)
+        cells[self.puzzle.player.position] = 'P'
+        return cells
+
+    def _update_grid(self):
+        cells = self._get_cells()
+        dirty_rows = set()
+        for position in self.cells.keys() - cells.keys():
+            self.rows[position[1]][2 * position[0]] = ord('.')
+            dirty_rows.add(position[1])
+        for position, char in cells.items():
+            if self.cells.get(position) != char:
+                self.rows[position[1]][2 * position[0]] = ord(char)
+                dirty_rows.add(position[1])
+        for y in dirty_rows:
+            self.row_text[y] = self.rows[y].decode()
+        self.cells = cells
+
+    def render_puzzle(self) -> str:
+        self._update_grid()
+        return '\n'.join(["Puzzle State: ", LEGEND, *reversed(self.row_text)])
+
+    def render_objects(self) -> str:
+        lines = []
+        for obj in self.puzzle.objects:
+            renderer = get_renderer(type(obj))
+            if renderer:
+                lines.extend(renderer[1](obj))
+        self.object_lines = lines
+        return '\n'.join(["Objects in puzzle:", *lines])
+
+    def render_player(self) -> str:
+        return '\n'.join(["Player Status:", self.puzzle.get_status()])
+
+    def render_state(self) -> str:
+        return '\n'.join([self.render_puzzle(), self.render_objects(), self.render_player()])
@@ -0,0 +1,163 @@
+import ast
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from link.puzzles.escaperoom.actions import Action, ActionHandler, get_type_name
+import link.puzzles.escaperoom.levels as levels
+from link.puzzles.escaperoom.results import open_sink
+from link.puzzles.escaperoom.solver import get_optimal_steps
+
+
+def _read_csv(path: Path) -> Iterator[Dict[str, Any]]:
+    # write_results_to_csv stores the conversation as the repr of a list of messages
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            result: Dict[str, Any] = dict(row)
+            result['conversation'] = ast.literal_eval(row['conversation']) if row.get('conversation') else []
+            result['is_solved'] = row.get('is_solved') == 'True'
+            for field in ('total_steps', 'num_iterations', 'seed'):
+                if row.get(field) not in (None, ''):
+                    result[field] = int(row[field])
+            yield result
+
+
+def read_episodes(path: Path, conversations: bool = True) -> Iterator[Dict[str, Any]]:
+    """Recorded episodes from play() output (.jsonl, .db) or write_results_to_csv (.csv, always with conversations)."""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(path)
+    if path.suffix == '.csv':
+        yield from _read_csv(path)
+        return
+    with open_sink(path) as sink:
+        yield from sink.read(conversations=conversations)
+
+
+def _has_turns(path: Path) -> bool:
+    # results from Runner.run_eval record each executed action in `turns`, so the conversations need not be read
+    episodes = read_episodes(path, conversations=False)
+    try:
+        first = next(episodes, None)
+    finally:
+        episodes.close()
+    return first is not None and bool(first.get('turns'))
+
+
+def get_actions(result: Dict[str, Any]) -> List[str]:
+    # the assistant messages that Runner actually executed
+    turns = result.get('turns')
+    if turns:
+        # only executed turns have an action; the last response of an episode that ran out of iterations does not
+        return [turn['action'] for turn in turns if 'action' in turn]
+    if 'conversation' not in result:
+        raise ValueError("Episode has neither turns nor a conversation to replay")
+    actions = [m['content'] for m in result.get('conversation', []) if m['role'] == 'assistant']
+    if not result.get('is_solved') and result.get('num_iterations') is not None:
+        # without per-turn records: an unsolved episode executed one action per iteration
+        actions = actions[:int(result['num_iterations'])]
+    return actions
+
+
+def get_level(puzzle_level: Any) -> levels.BaseLevel:
+    return levels.get_level(int(puzzle_level))
+
+
+def replay_episode(result: Dict[str, Any], trace: bool = True,
+                   level_factory: Callable[[Any], levels.BaseLevel] = get_level) -> Dict[str, Any]:
+    """Re-executes a recorded episode's actions on a fresh level and recomputes its metrics.
+
+    Actions stop once the puzzle is solved, like Runner.run_eval. With trace=True every step records the
+    action, its result, the player's position and inventory, button and door states, and the state after it 
+    (snapshot bytes as hex, to compare with GridPuzzle.snapshot()).
+    """
+    level = level_factory(result['puzzle_level'])
+    # from the starting state, before any action is replayed
+    optimal_steps = get_optimal_steps(level)
+    puzzle = level.puzzle
+    handler = ActionHandler(puzzle)
+    steps: List[Dict[str, Any]] = []
+    invalid = 0
+    executed = 0
+    for action in get_actions(result):
+        if puzzle.is_solved():
+            break
+        executed += 1
+        parsed = Action.parse(action)
+        if parsed is None:
+            invalid += 1
+        outcome = handler.execute(action)
+        if trace:
+            steps.append({
+                'action': action,
+                'valid': parsed is not None,
+                'result': outcome,
+                'steps': puzzle.steps,
+                'player': puzzle.player.position,
+                'inventory': get_type_name(type(puzzle.player.inventory)) if puzzle.player.inventory else None,
+                # one 0/1 flag per button and door of the level, in level order
+                'buttons_pressed': ''.join('1' if button.pressed else '0' for button in puzzle._buttons),
+                'doors_open': ''.join('1' if door.open else '0' for door in puzzle._doors),
+                'solved': bool(puzzle.is_solved()),
+                'state': puzzle.snapshot().hex(),
+            })
+
+    is_solved = bool(puzzle.is_solved())
+    efficiency = None
+    if is_solved and optimal_steps is not None:
+        efficiency = optimal_steps / puzzle.steps if puzzle.steps else 1.0
+    replayed = {
+        'model': result.get('model'),
+        'puzzle_level': result['puzzle_level'],
+        'seed': result.get('seed', 0),
+        'total_steps': puzzle.steps,
+        'is_solved': is_solved,
+        'num_actions': executed,
+        'invalid_actions': invalid,
+        'optimal_steps': optimal_steps,
+        'efficiency': efficiency,
+        'recorded_total_steps': result.get('total_steps'),
+        'recorded_is_solved': result.get('is_solved'),
+    }
+    replayed['matches_recorded'] = (replayed['recorded_total_steps'] in (None, puzzle.steps)
+                                    and replayed['recorded_is_solved'] in (None, is_solved))
+    if trace:
+        replayed['trace'] = steps
+    return replayed
+
+
+def replay(path: str, output: Optional[str] = None, trace: bool = False) -> Dict[str, Any]:
+    """Replays every episode in `path`, writing the replayed results to `output` (.jsonl) if given."""
+    out = open(output, 'w') if output else None
+    episodes = solved = mismatched = 0
+    start = time.perf_counter()
+    try:
+        for result in read_episodes(Path(path), conversations=not _has_turns(Path(path))):
+            replayed = replay_episode(result, trace=trace)
+            episodes += 1
+            solved += replayed['is_solved']
+            mismatched += not replayed['matches_recorded']
+            if out:
+                out.write(json.dumps(replayed, default=str) + "\n")
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+    summary = {
+        'episodes': episodes,
+        'solved': solved,
+        'mismatched': mismatched,
+        'episodes_per_sec': episodes / elapsed if elapsed else 0.0,
+    }
+    print(f"Replayed {episodes} episodes ({summary['episodes_per_sec']:.0f}/s): {solved} solved, "
+          f"{mismatched} differ from the recorded result")
+    return summary
+
+
+if __name__ == '__main__':
+    import fire
+    fire.Fire(replay)
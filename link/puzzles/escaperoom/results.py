@@ -0,0 +1,263 @@
+from abc import ABC, abstractmethod
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Set, Tuple
+
+# (model, puzzle_level, seed) identifies one episode of a sweep
+EpisodeKey = Tuple[str, str, int]
+
+SUMMARY_FIELDS = ['model', 'puzzle_level', 'seed', 'total_steps', 'is_solved', 'num_iterations', 'optimal_steps', 'efficiency']
+
+
+def get_episode_key(result: Dict[str, Any]) -> EpisodeKey:
+    return (result['model'], str(result['puzzle_level']), int(result.get('seed', 0)))
+
+
+def split_result(result: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    # conversations are large, so they are stored apart from the per-episode summary
+    summary = {k: v for k, v in result.items() if k != 'conversation'}
+    return summary, result.get('conversation', [])
+
+
+class ResultSink(ABC):
+    """Writes episodes as soon as they finish. Subclasses must make write() durable before returning."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def write(self, result: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def completed(self) -> Set[EpisodeKey]:
+        pass
+
+    @abstractmethod
+    def read(self, conversations: bool = True) -> Iterator[Dict[str, Any]]:
+        # full results in the order they were written; conversations=False leaves them out, which is much cheaper
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonlSink(ResultSink):
+    """One summary line per episode in `path`, conversations in `<path stem>.conversations.jsonl`."""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conversations_path = self.path.with_name(f"{self.path.stem}.conversations.jsonl")
+        self._completed = self._read_completed()
+        self.episodes = self._open_for_append(self.path)
+        self.conversations = self._open_for_append(self.conversations_path)
+
+    def _open_for_append(self, path: Path):
+        f = open(path, 'a+')
+        # start on a fresh line if a crashed run left a partial record behind
+        if f.tell() > 0:
+            f.seek(f.tell() - 1)
+            if f.read(1) != "\n":
+                f.write("\n")
+        return f
+
+    def _read_completed(self) -> Set[EpisodeKey]:
+        if not self.path.exists():
+            return set()
+        completed = set()
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    completed.add(get_episode_key(json.loads(line)))
+                except (ValueError, KeyError):
+                    # a partially written last line from a crashed run
+                    continue
+        return completed
+
+    def _append(self, f, record: Dict[str, Any]):
+        f.write(json.dumps(record, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    def write(self, result: Dict[str, Any]):
+        summary, conversation = split_result(result)
+        key = get_episode_key(result)
+        with self.lock:
+            # the conversation goes first, so a recorded summary always has its conversation
+            self._append(self.conversations, {'model': key[0], 'puzzle_level': key[1], 'seed': key[2], 'conversation': conversation})
+            self._append(self.episodes, summary)
+            self._completed.add(key)
+
+    def completed(self) -> Set[EpisodeKey]:
+        with self.lock:
+            return set(self._completed)
+
+    def _read_lines(self, path: Path) -> Iterator[Dict[str, Any]]:
+        with open(path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def read(self, conversations: bool = True) -> Iterator[Dict[str, Any]]:
+        with self.lock:
+            self.episodes.flush()
+            self.conversations.flush()
+        if not conversations:
+            yield from self._read_lines(self.path)
+            return
+        by_key = {}
+        for record in self._read_lines(self.conversations_path):
+            by_key[get_episode_key(record)] = record['conversation']
+        for summary in self._read_lines(self.path):
+            yield {**summary, 'conversation': by_key.get(get_episode_key(summary), [])}
+
+    def close(self):
+        self.episodes.close()
+        self.conversations.close()
+
+
+class SqliteSink(ResultSink):
+    """Episodes and conversation messages in two SQLite tables, committed per episode."""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        # sqlalchemy is only needed for this sink, so it is not imported with the rest of the package
+        import sqlalchemy as sa
+
+        self.sa = sa
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.engine = sa.create_engine(f"sqlite:///{path}")
+        metadata = sa.MetaData()
+        self.episodes = sa.Table(
+            'episodes', metadata,
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('model', sa.String, nullable=False),
+            sa.Column('puzzle_level', sa.String, nullable=False),
+            sa.Column('seed', sa.Integer, nullable=False),
+            sa.Column('total_steps', sa.Integer),
+            sa.Column('is_solved', sa.Boolean),
+            sa.Column('num_iterations', sa.Integer),
+            sa.Column('optimal_steps', sa.Integer),
+            sa.Column('efficiency', sa.Float),
+            # everything else in the result, as JSON
+            sa.Column('metrics', sa.Text),
+            sa.UniqueConstraint('model', 'puzzle_level', 'seed'),
+        )
+        self.conversations = sa.Table(
+            'conversations', metadata,
+            sa.Column('episode_id', sa.Integer, sa.ForeignKey('episodes.id'), nullable=False),
+            sa.Column('turn', sa.Integer, nullable=False),
+            sa.Column('role', sa.String, nullable=False),
+            sa.Column('content', sa.Text),
+        )
+        metadata.create_all(self.engine)
+
+    def write(self, result: Dict[str, Any]):
+        summary, conversation = split_result(result)
+        model, level, seed = get_episode_key(result)
+        row = {field: summary.get(field) for field in SUMMARY_FIELDS}
+        row.update({'puzzle_level': level, 'seed': seed})
+        row['metrics'] = json.dumps({k: v for k, v in summary.items() if k not in SUMMARY_FIELDS}, default=str)
+
+        with self.lock, self.engine.begin() as conn:
+            episode_id = conn.execute(self.episodes.insert().values(**row)).inserted_primary_key[0]
+            if conversation:
+                conn.execute(self.conversations.insert(), [
+                    {'episode_id': episode_id, 'turn': i, 'role': m['role'], 'content': m['content']}
+                    for i, m in enumerate(conversation)
+                ])
+
+    def completed(self) -> Set[EpisodeKey]:
+        sa = self.sa
+        with self.engine.connect() as conn:
+            rows = conn.execute(sa.select(self.episodes.c.model, self.episodes.c.puzzle_level, self.episodes.c.seed))
+            return {(model, level, seed) for model, level, seed in rows}
+
+    def read(self, conversations: bool = True) -> Iterator[Dict[str, Any]]:
+        sa = self.sa
+        with self.engine.connect() as conn:
+            episodes = conn.execute(sa.select(self.episodes).order_by(self.episodes.c.id)).mappings()
+            if conversations:
+                # fetched up front so the conversation queries below can use the same connection
+                episodes = episodes.all()
+            for episode in episodes:
+                result = {field: episode[field] for field in SUMMARY_FIELDS}
+                result.update(json.loads(episode['metrics'] or '{}'))
+                if conversations:
+                    messages = conn.execute(
+                        sa.select(self.conversations.c.role, self.conversations.c.content)
+                        .where(self.conversations.c.episode_id == episode['id'])
+                        .order_by(self.conversations.c.turn)
+                    )
+                    result['conversation'] = [{'role': role, 'content': content} for role, content in messages]
+                yield result
+
+    def close(self):
+        self.engine.dispose()
+
+
+def open_sink(path: Path) -> ResultSink:
+    path = Path(path)
+    if path.suffix in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteSink(path)
+    if path.suffix == '.jsonl':
+        return JsonlSink(path)
+    raise ValueError(f"Unsupported results file {path}. Use .jsonl or .db/.sqlite")
+
+
+
+def get_shard_path(path: Path, shard: int) -> Path:
+    # results.jsonl -> results.shard3.jsonl, next to the merged file
+    path = Path(path)
+    return path.with_name(f"{path.stem}.shard{shard}{path.suffix}")
+
+
+def find_shards(path: Path) -> List[Path]:
+    path = Path(path)
+    if not path.parent.exists():
+        return []
+    pattern = re.compile(rf"{re.escape(path.stem)}\.shard\d+{re.escape(path.suffix)}")
+    return sorted(p for p in path.parent.iterdir() if pattern.fullmatch(p.name))
+
+
+def remove_results(path: Path):
+    path = Path(path)
+    paths = [path]
+    if path.suffix == '.jsonl':
+        paths.append(path.with_name(f"{path.stem}.conversations.jsonl"))
+    for p in paths:
+        if p.exists():
+            p.unlink()
+
+
+def merge_results(paths: Sequence[Path], sink: ResultSink) -> Tuple[int, int]:
+    """Copies the episodes in `paths` into `sink`, skipping any episode already in it.
+
+    Returns (episodes written, duplicates skipped).
+    """
+    completed = sink.completed()
+    written = duplicates = 0
+    for path in paths:
+        with open_sink(path) as source:
+            for result in source.read():
+                key = get_episode_key(result)
+                if key in completed:
+                    duplicates += 1
+                    continue
+                sink.write(result)
+                completed.add(key)
+                written += 1
+    return written, duplicates
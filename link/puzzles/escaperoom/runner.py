@@ -1,12 +1,21 @@
-from link.puzzles.escaperoom.actions import ActionHandler
+from link.puzzles.escaperoom.actions import Action, ActionHandler
 from link.puzzles.escaperoom.entities import GridPuzzle
 import link.puzzles.escaperoom.levels as levels 
 
-from typing import Dict
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 import re 
-import aisuite as ai
+import time
+from link.puzzles.escaperoom.scheduler import TRANSIENT_ERRORS, RateLimiter, call_with_retries, get_provider, is_transient
+from link.puzzles.escaperoom.clients import CACHE_MARKERS, STREAM_USAGE_PROVIDERS, ChatClient, get_client_registry
+from link.puzzles.escaperoom.solver import get_optimal_steps
+from link.puzzles.escaperoom.cache import ResponseCache
+from link.puzzles.escaperoom.metrics import MetricsCallback, get_usage, summarize_turns
 from link.puzzles.escaperoom.utils import print_puzzle_state, print_available_actions, print_object_state, print_player_state
+from link.puzzles.escaperoom.utils import print_state_delta, estimate_tokens
+from link.puzzles.escaperoom.renderer import GridRenderer
 
+# the same for every level and episode, so providers can cache it as the start of every prompt
 SYSTEM_PROMPT = """Goal: Your goal is to reach and open the door.
 
 Rules:
@@ -26,8 +35,10 @@ Example actions:
     - move down
     - pick_up rock
     - drop rock
+"""
 
-Currently available actions:
+# the first user message; the level's state is kept out of the system prompt so the rules stay a shared prefix
+INITIAL_STATE_PROMPT = """Currently available actions:
 {available_actions}
 
 Current state:
@@ -44,71 +55,391 @@ Current state:
 {state}
 """
 
+# used by prompt_mode="delta": the full state is only sent in the first user message
+DELTA_STATE_PROMPT = """Action result: 
+{content}
+
+Currently available actions:
+{available_actions}
+
+Changes since your last action:
+{changes}
+"""
+
+HISTORY_SUMMARY_PROMPT = """Earlier turns are no longer shown. Actions you took in the {num_turns} hidden turns:
+{actions}
+
+State before the turns that follow:
+{state}
+"""
+
+PROMPT_MODES = ("full", "delta")
+# why run_eval stopped, recorded as termination_reason
+TERMINATION_REASONS = ("solved", "max_iterations", "invalid_actions", "loop", "no_progress")
+
+def find_action_line(text: str, start: int = 0, final: bool = True) -> Tuple[Optional[str], int]:
+    """The first line of text (from `start`) that begins with an action, and the offset where to stop reading.
+
+    Returns the action and the end of its line, or None and the start of the last line to look at again once more text 
+    has arrived. Action.parse only reads the first two words, so with final=False (more text may follow) the last line 
+    counts once its second word is complete.
+    """
+    while True:
+        end = text.find("\n", start)
+        line = text[start:] if end == -1 else text[start:end]
+        words = line.split()
+        if len(words) >= 2 and (final or end != -1 or len(words) > 2 or line[-1].isspace()):
+            action = " ".join(words[:2])
+            if Action.parse(action) is not None:
+                return action, len(text) if end == -1 else end
+        if end == -1:
+            return None, start
+        start = end + 1
+
+
 class Runner:
-    def __init__(self: str = "", model: str = "openai:gpt-4o", puzzle_level: int=1):
-        self.client = ai.Client() #OpenAI(api_key=api_key)
+    def __init__(self: str = "", model: str = "openai:gpt-4o", puzzle_level: Union[int, levels.BaseLevel]=1, rate_limiter: Optional[RateLimiter] = None, max_retries: int = 0, 
+                 prompt_mode: str = "full", history_window: Optional[int] = None, cache: Optional[ResponseCache] = None, temperature: float = 0.5, 
+                 metrics_callback: Optional[MetricsCallback] = None, client: Optional[ChatClient] = None, 
+                 prompt_cache: Union[bool, Sequence[str]] = False, max_invalid_actions: Optional[int] = None, 
+                 max_state_visits: Optional[int] = None, max_no_progress: Optional[int] = None, stream: bool = False, 
+                 seed: int = 0):
+        if prompt_mode not in PROMPT_MODES:
+            raise ValueError(f"Unknown prompt mode {prompt_mode}. Choose from {PROMPT_MODES}")
+        if history_window is not None and history_window < 1:
+            # the window has to keep the latest message, which holds the result of the last action
+            raise ValueError(f"history_window must be at least 1 or None, got {history_window}")
+        # any object with chat.completions.create works; by default the process-wide client for the model's provider, 
+        # so connections are reused across episodes. "local:<policy>" models run offline
+        if client is None:
+            if stream and not get_client_registry().can_stream(model):
+                raise ValueError(f"Streaming is not supported for {model}: its aisuite provider does not pass streams through")
+            client = get_client_registry().get(model)
+        self.client = client
         self.model = model
-        self.level = levels.get_level(puzzle_level)
+        self.temperature = temperature
+        self.cache = cache
+        # the episode's repetition, part of the response cache key so repetitions get their own responses
+        self.seed = seed
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.prompt_mode = prompt_mode
+        # True, or the providers to add prompt cache markers for; providers without markers cache on their own
+        enabled = prompt_cache is True or (not isinstance(prompt_cache, bool) and get_provider(model) in prompt_cache)
+        self.cache_markers = CACHE_MARKERS.get(get_provider(model)) if enabled else None
+        # early termination, each off when None: responses that do not parse as an action, visits to the same puzzle 
+        # state (repeating an invalid action or oscillating between cells), and actions in a row that reach no new state
+        self.max_invalid_actions = max_invalid_actions
+        self.max_state_visits = max_state_visits
+        self.max_no_progress = max_no_progress
+        self.invalid_actions = 0
+        # stream completions and stop reading at the first line that is an action, which is what gets executed
+        self.stream = stream
+        # number of most recent messages (besides the system prompt) sent to the model, None sends everything
+        self.history_window = history_window
+        self.prompt_tokens: List[int] = []
+        self.baseline_prompt_tokens: List[int] = []
+        # one entry per LLM call: latency, prompt rendering and action execution time, provider token usage
+        self.turns: List[Dict] = []
+        self.metrics_callback = metrics_callback
+        self._render_time = 0.0
+        # a level number, or an already built level such as one from generator.load_corpus
+        self.level = puzzle_level if isinstance(puzzle_level, levels.BaseLevel) else levels.get_level(puzzle_level)
         self.puzzle, self.available_actions = self.level.get_level()
         self.action_handler = ActionHandler(self.puzzle)
+        if hasattr(self.client, "bind"):
+            # local policies such as the solver oracle read the puzzle directly
+            self.client.bind(self.puzzle)
+        self.renderer = GridRenderer(self.puzzle)
+        self.optimal_steps = get_optimal_steps(self.level)
+        # snapshot -> number of times the puzzle was in that state after an action
+        self._state_visits: Counter = Counter()
+        self._turns_without_progress = 0
+        self._episode_start: Optional[float] = None
+        self._time_to_first_action: Optional[float] = None
         self.conversation_history = []
         self._initialize_conversation() 
     
     def _initialize_conversation(self): 
         # could also reset conversation if needed
+        start = time.perf_counter()
         initial_state = self._get_current_state()
-        system_message = SYSTEM_PROMPT.format(
+        initial_message = INITIAL_STATE_PROMPT.format(
             available_actions=self.action_handler.get_available_actions(), 
             state=initial_state
         )
-        self.conversation_history = [{"role": "system", "content": system_message}]
+        self.conversation_history = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": initial_message}]
+        # full state at the time each user message was added, used to summarize truncated history
+        self._full_states: Dict[int, str] = {1: initial_state}
+        self._last_cells = self.renderer.cells
+        self._last_objects = self.renderer.object_lines
+        self._last_actions = self.action_handler.get_available_actions()
+        # what the prompt would have cost without delta prompts or truncation
+        self._baseline_history_tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(initial_message)
+        self._render_time = time.perf_counter() - start
 
     def _get_current_state(self): 
-        return "\n".join([
-            print_puzzle_state(self.puzzle), 
-            print_object_state(self.puzzle), 
-            print_player_state(self.puzzle)
-        ])
+        # same text as utils.print_puzzle_state/print_object_state/print_player_state, rendered incrementally
+        return self.renderer.render_state()
     
-    def get_llm_response(self) -> str:
-        response = self.client.chat.completions.create(
+    def _get_state_delta(self) -> str:
+        # uses the cells and object lines from the last _get_current_state() call
+        cells = self.renderer.cells
+        objects = self.renderer.object_lines
+        delta = print_state_delta(self._last_cells, cells, self._last_objects, objects, self.puzzle)
+        self._last_cells, self._last_objects = cells, objects
+        return delta
+
+    def _get_messages(self) -> List[Dict[str, str]]:
+        history = self.conversation_history
+        if self.history_window is None or len(history) - 1 <= self.history_window:
+            return history
+
+        # keep the window starting on an assistant message so roles still alternate after the summary. 
+        # The summary changes as the window slides, so only the system prompt stays a cacheable prefix
+        start = len(history) - self.history_window
+        if history[start]["role"] != "assistant":
+            start -= 1
+        hidden = history[1:start]
+        summary = HISTORY_SUMMARY_PROMPT.format(
+            num_turns=sum(1 for m in hidden if m["role"] == "assistant"),
+            actions="\n".join(f"- {m['content'].strip()}" for m in hidden if m["role"] == "assistant"),
+            state=self._full_states[start - 1]
+        )
+        return [history[0], {"role": "user", "content": summary}] + history[start:]
+
+    def _create_completion(self, messages: List[Dict[str, str]], **kwargs):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        if self.cache_markers:
+            # added last, so the response cache and token estimates see plain messages
+            messages = self.cache_markers(messages)
+        return self.client.chat.completions.create(
             model=self.model,
-            messages=self.conversation_history, 
-            temperature=0.5
+            messages=messages, 
+            temperature=self.temperature, 
+            **kwargs
         )
-        content = response.choices[0].message.content
+
+    def _read_stream(self, messages: List[Dict[str, str]]) -> Tuple[str, Dict, bool]:
+        # content up to the end of the first action line, usage, and whether the rest of the stream was dropped
+        kwargs = {"stream_options": {"include_usage": True}} if get_provider(self.model) in STREAM_USAGE_PROVIDERS else {}
+        stream = self._create_completion(messages, stream=True, **kwargs)
+        received = ""
+        start = 0
+        usage = {}
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = get_usage(chunk)
+                if not chunk.choices:
+                    continue
+                received += chunk.choices[0].delta.content or ""
+                action, start = find_action_line(received, start, final=False)
+                if action is not None:
+                    # a cut stream reports no usage: estimate both sides instead
+                    content = received[:start]
+                    return content, {"input_tokens": self.prompt_tokens[-1], "output_tokens": estimate_tokens(content), 
+                                     "cached_input_tokens": None}, True
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        # providers that send no usage chunk get the same estimates as a cut stream
+        return received, usage or {"input_tokens": self.prompt_tokens[-1], "output_tokens": estimate_tokens(received), 
+                                   "cached_input_tokens": None}, False
+
+    def prepare_request(self) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        # the messages for the next response, and the response itself if the response cache has it
+        messages = self._get_messages()
+        self.prompt_tokens.append(sum(estimate_tokens(m["content"]) for m in messages))
+        self.baseline_prompt_tokens.append(self._baseline_history_tokens)
+
+        self._request_start = time.perf_counter()
+
+        content = None
+        if self.cache:
+            self._cache_key = self.cache.get_key(self.model, self.temperature, messages, self.seed, self.stream)
+            content = self.cache.get(self._cache_key)
+            if content is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+        return messages, content
+
+    def record_response(self, content: str, usage: Optional[Dict] = None, cached: bool = False, stopped: bool = False) -> str:
+        # adds the response to prepare_request()'s messages to the history and returns the action to execute
+        if self.cache and not cached:
+            self.cache.put(self._cache_key, content)
+        action = content
+        if self.stream:
+            action = find_action_line(content)[0] or content
+
+        self.turns.append({
+            'turn': len(self.turns), 
+            # with streaming, until the action line arrived; in batch mode, until the batch finished
+            'llm_latency': time.perf_counter() - self._request_start, 
+            'stream_stopped': stopped, 
+            'render_time': self._render_time, 
+            'action_time': 0.0, 
+            'cached': cached, 
+            **(usage or {"input_tokens": None, "output_tokens": None, "cached_input_tokens": None})
+        })
+        self._render_time = 0.0
         self.conversation_history.append({"role": "assistant", "content": content})
+        self._baseline_history_tokens += estimate_tokens(content)
+        if self._time_to_first_action is None and self._episode_start is not None:
+            self._time_to_first_action = time.perf_counter() - self._episode_start
         #print(f"LLM Action: {content}")
-        return content
+        return action
 
-    def send_message(self, message: str) -> str:
+    def get_llm_response(self) -> str:
+        messages, content = self.prepare_request()
+        cached = content is not None
+        usage = None
+        stopped = False
+        if content is None:
+            if self.stream:
+                # a stream that fails part way is read again from the start
+                content, usage, stopped = call_with_retries(lambda: self._read_stream(messages), max_retries=self.max_retries,
+                                                            retry_on=TRANSIENT_ERRORS, retry_if=is_transient)
+            else:
+                response = call_with_retries(lambda: self._create_completion(messages), max_retries=self.max_retries,
+                                             retry_on=TRANSIENT_ERRORS, retry_if=is_transient)
+                content = response.choices[0].message.content
+                usage = get_usage(response)
+        return self.record_response(content, usage, cached=cached, stopped=stopped)
+
+    def add_action_result(self, message: str):
         #print(f"Game State update: {message}")
-        new_message = STATE_PROMPT.format(
+        start = time.perf_counter()
+        available_actions = self.action_handler.get_available_actions()
+        state = self._get_current_state()
+        full_message = STATE_PROMPT.format(
             content=message, 
-            available_actions=self.action_handler.get_available_actions(), 
-            state=self._get_current_state()
+            available_actions=available_actions, 
+            state=state
         )
+        self._baseline_history_tokens += estimate_tokens(full_message)
+
+        if self.prompt_mode == "delta":
+            new_message = DELTA_STATE_PROMPT.format(
+                content=message, 
+                available_actions=available_actions if available_actions != self._last_actions else "(unchanged)", 
+                changes=self._get_state_delta()
+            )
+            self._last_actions = available_actions
+        else:
+            new_message = full_message
+
+        self._full_states[len(self.conversation_history)] = state
         self.conversation_history.append({"role": "user", "content": new_message})
+        self._render_time = time.perf_counter() - start
+
+    def send_message(self, message: str) -> str:
+        self.add_action_result(message)
         return self.get_llm_response()
              
     
-    def run_eval(self, max_iterations: int = 30) -> dict:        
-        iteration = 0
-        action = self.get_llm_response()
-        while iteration < max_iterations:
-            result = self.action_handler.execute(action)
+    def _execute(self, action: str) -> str:
+        start = time.perf_counter()
+        result = self.action_handler.execute(action)
+        turn = self.turns[-1]
+        turn['action_time'] = time.perf_counter() - start
+        turn['action'] = action
+        turn['valid'] = Action.parse(action) is not None
+        self.invalid_actions += not turn['valid']
+        if self.metrics_callback:
+            self.metrics_callback("turn", turn)
+        return result
 
-            if self.puzzle.is_solved(): 
-                break 
+    def _check_termination(self) -> Optional[str]:
+        # called after every action that did not solve the puzzle
+        if self.max_invalid_actions is not None and self.invalid_actions >= self.max_invalid_actions:
+            return "invalid_actions"
+        if self.max_state_visits is None and self.max_no_progress is None:
+            return None
+        state = self.puzzle.snapshot()
+        self._state_visits[state] += 1
+        visits = self._state_visits[state]
+        self._turns_without_progress = 0 if visits == 1 else self._turns_without_progress + 1
+        if self.max_state_visits is not None and visits >= self.max_state_visits:
+            return "loop"
+        if self.max_no_progress is not None and self._turns_without_progress >= self.max_no_progress:
+            return "no_progress"
+        return None
 
-            action = self.send_message(result)
-            iteration += 1
-        #print(self.conversation_history)
+    def start_episode(self, max_iterations: int = 30):
+        self._episode_start = time.perf_counter()
+        self._max_iterations = max_iterations
+        self._iteration = 0
+        self._time_to_solve = None
+        self._termination_reason = "max_iterations"
+        # the starting state counts as visited, so walking away and back is a revisit
+        self._state_visits[self.puzzle.snapshot()] += 1
+
+    def advance(self, action: str) -> bool:
+        # executes the action; True if the episode goes on and the next prompt is ready for prepare_request()
+        if self._iteration >= self._max_iterations:
+            return False
+        result = self._execute(action)
+
+        if self.puzzle.is_solved(): 
+            self._time_to_solve = time.perf_counter() - self._episode_start
+            self._termination_reason = "solved"
+            return False
+
+        reason = self._check_termination()
+        if reason:
+            self._termination_reason = reason
+            return False
+
+        self.add_action_result(result)
+        self._iteration += 1
+        return True
+
+    def finish_episode(self) -> dict:
+        is_solved = self.puzzle.is_solved()
+        efficiency = None
+        if is_solved and self.optimal_steps is not None:
+            # 1.0 means the model found a shortest solution
+            efficiency = self.optimal_steps / self.puzzle.steps if self.puzzle.steps else 1.0
+
+        metrics = {
+            'wall_time': time.perf_counter() - self._episode_start, 
+            'time_to_solve': self._time_to_solve, 
+            'time_to_first_action': self._time_to_first_action, 
+            'termination_reason': self._termination_reason, 
+            'invalid_actions': self.invalid_actions, 
+            **summarize_turns(self.turns)
+        }
+        if self.metrics_callback:
+            self.metrics_callback("episode", metrics)
 
         return {
             'total_steps': self.puzzle.steps, 
-            'is_solved': self.puzzle.is_solved(), 
-            'num_iterations': iteration, 
+            'is_solved': is_solved, 
+            'num_iterations': self._iteration, 
+            'optimal_steps': self.optimal_steps, 
+            'efficiency': efficiency, 
+            'prompt_mode': self.prompt_mode, 
+            'total_prompt_tokens': sum(self.prompt_tokens), 
+            'baseline_prompt_tokens': sum(self.baseline_prompt_tokens), 
+            'prompt_tokens': self.prompt_tokens, 
+            'cache_hits': self.cache_hits, 
+            'cache_misses': self.cache_misses, 
+            **metrics, 
+            'turns': self.turns, 
             'conversation': self.conversation_history
         }
+
+    def run_eval(self, max_iterations: int = 30) -> dict:        
+        self.start_episode(max_iterations)
+        action = self.get_llm_response()
+        while self.advance(action):
+            action = self.get_llm_response()
+        #print(self.conversation_history)
+        return self.finish_episode()
     
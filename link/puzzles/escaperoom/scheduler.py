@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+
+def get_provider(model: str) -> str:
+    # aisuite models are written as "provider:model-name"
+    return model.split(":", 1)[0] if ":" in model else model
+
+
+class RateLimiter:
+    """Token bucket shared by every thread that talks to the same provider."""
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(requests_per_minute // 60)))
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        # returns the number of seconds spent waiting for a token
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ProviderRateLimits:
+    """One RateLimiter per `provider:` prefix; providers without a limit are not throttled."""
+
+    def __init__(self, requests_per_minute: Optional[Dict[str, float]] = None):
+        self.limiters: Dict[str, RateLimiter] = {
+            provider: RateLimiter(rpm) for provider, rpm in (requests_per_minute or {}).items()
+        }
+
+    def get(self, model: str) -> Optional[RateLimiter]:
+        return self.limiters.get(get_provider(model))
+
+
+# HTTP statuses worth retrying: request timeout, conflict, rate limit and server errors (529 is Anthropic's overloaded)
+RETRY_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+# transient errors of the provider SDKs (openai, anthropic, groq, ...) and httpx, matched by class name so no SDK
+# has to be imported to check for them
+TRANSIENT_ERROR_NAMES = frozenset({
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError", "OverloadedError",
+    "ServiceUnavailableError", "TimeoutException", "NetworkError", "RemoteProtocolError",
+})
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (TimeoutError, ConnectionError)
+
+
+def is_transient(error: BaseException) -> bool:
+    # rate limits, timeouts, dropped connections and 5xx responses; not authentication, bad requests or bugs
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRY_STATUS_CODES
+    # aisuite wraps some providers' errors in LLMError, raised while handling the original
+    cause = error.__cause__ or error.__context__
+    return type(error).__name__ == "LLMError" and cause is not None and is_transient(cause)
+
+
+def call_with_retries(
+    fn: Callable[[], T],
+    max_retries: int = 3,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    retry_on: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS,
+    retry_if: Callable[[BaseException], bool] = is_transient,
+) -> T:
+    # retries errors that are instances of retry_on or for which retry_if is true; anything else is raised at once
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as error:
+            if attempt >= max_retries or not (isinstance(error, retry_on) or retry_if(error)):
+                raise
+            # exponential backoff with full jitter so parallel workers do not retry in lockstep
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+
+
+def run_concurrently(jobs: Sequence[Any], fn: Callable[[Any], T], concurrency: int = 1) -> List[T]:
+    # results are returned in job order, not completion order
+    if concurrency <= 1:
+        return [fn(job) for job in jobs]
+
+    results: List[Optional[T]] = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(fn, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
@@ -0,0 +1,193 @@
+import heapq
+import itertools
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Tuple, Type
+
+from link.puzzles.escaperoom.actions import ActionHandler
+from link.puzzles.escaperoom.entities import GridPuzzle, GameObject, Door, Rock, PuzzleState
+from link.puzzles.escaperoom.levels import BaseLevel
+
+# objects the solver will pick up; GridPuzzle.equip only lets the player carry objects with carryable set (rocks)
+CARRYABLE: Tuple[Type[GameObject], ...] = (Rock,)
+
+
+@dataclass
+class Solution:
+    steps: int
+    actions: List[str] = field(default_factory=list)
+    expanded_states: int = 0
+
+
+_DIRECTIONS = {"up": (0, 1), "down": (0, -1), "left": (-1, 0), "right": (1, 0)}
+
+
+def _travel(puzzle: GridPuzzle, directions: List[str]):
+    # empty cells have no enter/leave effects, so the player can skip move_player for them
+    player = puzzle.player
+    occupied = puzzle._objects_by_position
+    for direction in directions:
+        dx, dy = _DIRECTIONS[direction]
+        x, y = player.position
+        new_position = (x + dx, y + dy)
+        if player.position in occupied or new_position in occupied:
+            puzzle.move_player(direction)
+        else:
+            player.position = new_position
+            puzzle.steps += 1
+
+
+Walks = Dict[Tuple[int, int], List[str]]
+
+
+def _walks(puzzle: GridPuzzle, start: Tuple[int, int], blocked: frozenset) -> Walks:
+    # breadth first from start: the shortest walk to every cell that enters no blocked cell on the way
+    width, height = puzzle.grid_size
+    parents: Dict[Tuple[int, int], Tuple[Tuple[int, int], str]] = {start: (start, "")}
+    queue = deque([start])
+    while queue:
+        x, y = position = queue.popleft()
+        for direction, (dx, dy) in _DIRECTIONS.items():
+            cell = (x + dx, y + dy)
+            if cell in parents or not (0 <= cell[0] < width and 0 <= cell[1] < height):
+                continue
+            parents[cell] = (position, direction)
+            if cell not in blocked:
+                queue.append(cell)
+    walks: Walks = {start: []}
+    for cell in parents:
+        if cell not in walks:
+            previous, direction = parents[cell]
+            walks[cell] = walks[previous] + [f"move {direction}"]
+    return walks
+
+
+def _heuristic(puzzle: GridPuzzle) -> int:
+    # moves are the only actions that cost steps, and the player has to end on the exit
+    doors = puzzle.get_objects_of_type(Door)
+    if not doors:
+        return 0
+    x, y = puzzle.player.position
+    return abs(x - doors[0].position[0]) + abs(y - doors[0].position[1])
+
+
+def _successors(puzzle: GridPuzzle, carryable: Tuple[Type[GameObject], ...], walks: Dict[Hashable, Walks]) -> List[List[str]]:
+    # what the player can do where it stands, then walks to every cell where it can do something else: cells that
+    # react to the player entering (buttons), the exit, and carryable objects when the hands are empty. Walks only
+    # cross cells nothing reacts to, so a walk that crosses a button is two walks and the button's effects are kept.
+    # Objects are only dropped on cells that react to it: anywhere else a drop changes nothing
+    position = puzzle.player.position
+    listeners = puzzle._listeners
+    held = puzzle.player.inventory
+    if held is None:
+        options = [[f"pick_up {name}"] for name in sorted({obj.__class__.__name__.lower() for obj in puzzle.get_objects_at(position)
+                                                            if isinstance(obj, carryable) and obj.carryable})]
+    else:
+        name = held.__class__.__name__.lower()
+        options = [[f"drop {name}"]] if position in listeners["drop"] else []
+        if position in listeners["pick_up"]:
+            # picking up with full hands still takes the held object's weight off the cell (see GridPuzzle.equip)
+            options.append([f"pick_up {name}"])
+
+    blocked = frozenset(listeners["enter"]) | frozenset(listeners["leave"])
+    targets = set(blocked)
+    doors = puzzle.get_objects_of_type(Door)
+    if doors:
+        # only the first door is the exit (see GridPuzzle.is_solved)
+        targets.add(doors[0].position)
+    if held is None:
+        targets.update(obj.position for obj in puzzle.objects if isinstance(obj, carryable) and obj.carryable)
+    targets.discard(position)
+
+    # buttons stay where they are, so the walks from each cell are usually found once per search
+    key = (position, blocked)
+    if key not in walks:
+        walks[key] = _walks(puzzle, position, blocked)
+    reachable = walks[key]
+    return options + [reachable[target] for target in sorted(targets) if target in reachable]
+
+
+def solve(puzzle: GridPuzzle, carryable: Tuple[Type[GameObject], ...] = CARRYABLE, max_states: int = 1_000_000) -> Optional[Solution]:
+    """A* over snapshots of the puzzle, returning the fewest moves needed to solve it from its current state.
+
+    Every action is tried, including walks across buttons, which press and release them on the way; walks
+    between cells where something can happen are one step of the search, which keeps large open grids small.
+    Objects are only dropped where something reacts to them. The puzzle is restored to its starting state
+    before returning. Returns None if it cannot be solved within max_states expansions.
+    """
+    handler = ActionHandler(puzzle)
+    start, start_steps = puzzle.snapshot(), puzzle.steps
+    counter = itertools.count()
+    best: Dict[PuzzleState, int] = {start: 0}
+    parents: Dict[PuzzleState, Tuple[Optional[PuzzleState], List[str]]] = {start: (None, [])}
+    frontier = [(_heuristic(puzzle), 0, next(counter), start)]
+    expanded = 0
+    walks: Dict[Hashable, Walks] = {}
+
+    try:
+        while frontier and expanded < max_states:
+            _, cost, _, state = heapq.heappop(frontier)
+            if cost > best[state]:
+                continue
+            expanded += 1
+            puzzle.restore(state)
+            if puzzle.is_solved():
+                actions = []
+                while state is not None:
+                    state, segment = parents[state]
+                    actions[:0] = segment
+                return Solution(steps=cost, actions=actions, expanded_states=expanded)
+
+            for actions in _successors(puzzle, carryable, walks):
+                puzzle.restore(state)
+                puzzle.steps = cost
+                if actions[0].startswith("move"):
+                    _travel(puzzle, [action.split()[1] for action in actions])
+                else:
+                    handler.execute(actions[0])
+                new_state, new_cost = puzzle.snapshot(), puzzle.steps
+                if new_cost < best.get(new_state, new_cost + 1):
+                    best[new_state] = new_cost
+                    parents[new_state] = (state, actions)
+                    heapq.heappush(frontier, (new_cost + _heuristic(puzzle), new_cost, next(counter), new_state))
+        return None
+    finally:
+        puzzle.restore(start)
+        puzzle.steps = start_steps
+
+
+def get_level_signature(puzzle: GridPuzzle) -> Hashable:
+    # what makes two puzzles the same for the solver: layout, object properties, links and current state
+    ids = {id(obj): i for i, obj in enumerate(puzzle._entities)}
+    entities = tuple(
+        (
+            type(obj).__name__,
+            getattr(obj, "weight", None),
+            getattr(obj, "weight_threshold", None),
+            tuple(ids.get(id(linked), -1) for linked in getattr(obj, "linked_objects", ())),
+        )
+        for obj in puzzle._entities
+    )
+    return puzzle.grid_size, puzzle.player.weight, entities, puzzle.snapshot()
+
+
+_solution_cache: Dict[Hashable, Optional[Solution]] = {}
+_cache_lock = threading.Lock()
+
+
+def solve_level(level: BaseLevel, carryable: Tuple[Type[GameObject], ...] = CARRYABLE) -> Optional[Solution]:
+    # cached per level layout, so repeated episodes of the same level are only solved once
+    key = (get_level_signature(level.puzzle), carryable)
+    with _cache_lock:
+        if key in _solution_cache:
+            return _solution_cache[key]
+    solution = solve(level.puzzle, carryable)
+    with _cache_lock:
+        _solution_cache[key] = solution
+    return solution
+
+
+def get_optimal_steps(level: BaseLevel) -> Optional[int]:
+    solution = solve_level(level)
+    return solution.steps if solution else None
@@ -1,5 +1,5 @@
 from link.puzzles.escaperoom.entities import GridPuzzle, Door, Button, Rock
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import csv
 import json 
 
@@ -55,3 +55,37 @@ def print_available_actions(available_actions: Dict) -> str:
         display_str.append(f"- {action}: {description}")
     
     return "\n".join(display_str)
+
+
+# describe only what changed between two renders (see renderer.GridRenderer.cells/object_lines)
+def print_state_delta(old_cells: Dict[Tuple[int, int], str], new_cells: Dict[Tuple[int, int], str], 
+                      old_objects: List[str], new_objects: List[str], puzzle: GridPuzzle) -> str:
+    display_str = []
+
+    changed_cells = [
+        (pos, old_cells.get(pos, '.'), new_cells.get(pos, '.')) 
+        for pos in sorted(set(old_cells) | set(new_cells)) 
+        if old_cells.get(pos, '.') != new_cells.get(pos, '.')
+    ]
+    if changed_cells:
+        display_str.append("Changed cells (old -> new):")
+        for pos, old, new in changed_cells:
+            display_str.append(f"- {pos}: {old} -> {new}")
+
+    old_set = set(old_objects)
+    changed_objects = [line for line in new_objects if line not in old_set and line.startswith('- ')]
+    removed_objects = [line for line in old_objects if line not in set(new_objects) and line.startswith('- ')]
+    if changed_objects or removed_objects:
+        display_str.append("Changed objects:")
+        display_str.extend(changed_objects)
+        display_str.extend(f"{line} (no longer there)" for line in removed_objects)
+
+    if not display_str:
+        display_str.append("No changes to the puzzle.")
+
+    display_str.append(print_player_state(puzzle))
+    return '\n'.join(display_str)
+
+def estimate_tokens(text: str) -> int:
+    # rough provider-independent estimate (~4 characters per token)
+    return (len(text) + 3) // 4
@@ -1,15 +1,23 @@
-from typing import List
+from typing import List, Dict, Optional
 import argparse
 import os 
 
-from link.puzzles.escaperoom.play import play
+from link.puzzles import get_puzzle, list_puzzles
 
-CURRENT_PUZZLES = ['escaperoom']
+CURRENT_PUZZLES = list_puzzles()
 
-def main(tests: List[str], model: List[str], print_results:bool):
+def main(tests: List[str], model: List[str], print_results:bool, concurrency: int = 1, requests_per_minute: Optional[Dict[str, float]] = None, 
+         cache_dir: Optional[str] = None, cache_mode: str = "readwrite", processes: int = 1, repetitions: Optional[int] = None, 
+         ci_width: Optional[float] = None, prompt_cache: Optional[List[str]] = None, 
+         max_invalid_actions: Optional[int] = None, max_state_visits: Optional[int] = None, max_no_progress: Optional[int] = None, 
+         client_timeout: float = 60.0, stream: bool = False, batch: bool = False):
     for test in tests:
-        if test == "escaperoom":
-            play(models=model, print_results=print_results)
+        play = get_puzzle(test)
+        play(models=model, print_results=print_results, concurrency=concurrency, requests_per_minute=requests_per_minute, 
+             cache_dir=cache_dir, cache_mode=cache_mode, processes=processes, repetitions=repetitions, ci_width=ci_width, 
+             prompt_cache=prompt_cache or False, max_invalid_actions=max_invalid_actions, max_state_visits=max_state_visits, 
+             max_no_progress=max_no_progress, client_timeout=client_timeout, 
+             stream=stream, batch=batch)
     return
 
 if __name__ == '__main__':
@@ -17,6 +25,22 @@ if __name__ == '__main__':
     parser.add_argument('--tests', nargs='+', default=["escaperoom"], choices=CURRENT_PUZZLES, help="Tests that we currently have available to run.")
     parser.add_argument('--models', nargs='+', default=["openai:gpt-4o"], help="Models to test. Current models are limited by models provided by andrewyng/aisuite.")
     parser.add_argument('--print', action='store_true', help="Set if you want to print out conversations. Useful for debugging.")
+    parser.add_argument('--concurrency', type=int, default=1, help="Number of episodes to run at the same time.")
+    parser.add_argument('--rpm', nargs='+', default=[], help="Per-provider request limits per minute, e.g. openai=500 anthropic=50.")
+    parser.add_argument('--cache-dir', default=None, help="Directory for cached LLM responses. Caching is off if not set.")
+    parser.add_argument('--cache-mode', default="readwrite", choices=["readwrite", "record", "replay"], help="replay only uses cached responses and never calls a provider.")
+    parser.add_argument('--processes', type=int, default=1, help="Worker processes to shard episodes across. Results are merged into one file at the end.")
+    parser.add_argument('--repetitions', type=int, default=None, help="Episodes per model and level. Results include the solve rate with a 95%% confidence interval.")
+    parser.add_argument('--ci-width', type=float, default=None, help="Stop repeating a model and level once its solve rate confidence interval is this narrow, e.g. 0.2.")
+    parser.add_argument('--prompt-cache', nargs='+', default=None, help="Providers to send prompt cache markers to, e.g. anthropic.")
+    parser.add_argument('--max-invalid-actions', type=int, default=None, help="End an episode after this many responses that are not an action.")
+    parser.add_argument('--max-state-visits', type=int, default=None, help="End an episode once the puzzle is in the same state this many times.")
+    parser.add_argument('--max-no-progress', type=int, default=None, help="End an episode after this many actions in a row that reach no new state.")
+    parser.add_argument('--client-timeout', type=float, default=60.0, help="Seconds before a provider request times out.")
+    parser.add_argument('--stream', action='store_true', help="Stream responses and stop reading after the first line that is an action.")
+    parser.add_argument('--batch', action='store_true', help="Play episodes in lockstep through the provider's batch API, one batch job per turn.")
     args = parser.parse_args()
-    main(args.tests, args.models, args.print)
+    rpm = {provider: float(limit) for provider, limit in (item.split('=', 1) for item in args.rpm)}
+    main(args.tests, args.models, args.print, args.concurrency, rpm, args.cache_dir, args.cache_mode, args.processes, args.repetitions, args.ci_width, args.prompt_cache, 
+         args.max_invalid_actions, args.max_state_visits, args.max_no_progress, args.client_timeout, args.stream, args.batch)
     #main(["escaperoom"], ["openai:gpt-4o"])
\ No newline at end of file
@@ -0,0 +1,94 @@
+import random
+import unittest
+from collections import deque
+
+from link.puzzles.escaperoom import levels
+from link.puzzles.escaperoom.actions import ActionHandler
+from link.puzzles.escaperoom.batch import BatchPuzzle
+from link.puzzles.escaperoom.clients import LocalClient, OraclePolicy, ScriptedPolicy
+from link.puzzles.escaperoom.generator import GeneratedLevel, LevelSpec, random_spec
+from link.puzzles.escaperoom.runner import Runner
+from link.puzzles.escaperoom.solver import solve
+
+# solves level 1 in 4 moves if buttons can be carried: picking up the pressed button keeps the door open
+CARRY_BUTTON = ["move up", "move right", "pick_up button", "move down", "move right"]
+EVERY_ACTION = ["move up", "move down", "move left", "move right", "pick_up rock", "drop rock"]
+# walking over the 150 button with the rock releases it and closes the door the other button opened, so the solver
+# used to plan around it in 10 moves
+CROSSING = LevelSpec(seed=16, grid_size=(5, 5), player_start=(1, 0), doors=[(2, 3), (1, 3)],
+                     buttons=[((4, 2), 50, [0]), ((2, 2), 150, [0, 1])], rocks=[(0, 3), (2, 1)])
+CROSSING_ROUTE = ["move up", "move right", "pick_up rock", "move up", "move right", "move right", "drop rock",
+                  "move up", "move left", "move left"]
+
+
+def brute_force(puzzle) -> int:
+    # fewest moves over every action, dropping anywhere, breadth first (pick_up/drop cost no steps)
+    handler = ActionHandler(puzzle)
+    start = puzzle.snapshot()
+    steps = {start: 0}
+    queue = deque([start])
+    while queue:
+        state = queue.popleft()
+        puzzle.restore(state)
+        if puzzle.is_solved():
+            puzzle.restore(start)
+            return steps[state]
+        for action in EVERY_ACTION:
+            puzzle.restore(state)
+            puzzle.steps = 0
+            handler.execute(action)
+            new_state, cost = puzzle.snapshot(), steps[state] + puzzle.steps
+            if cost < steps.get(new_state, cost + 1):
+                steps[new_state] = cost
+                queue.appendleft(new_state) if cost == steps[state] else queue.append(new_state)
+    puzzle.restore(start)
+    return None
+
+
+class EfficiencyTest(unittest.TestCase):
+    def run_episode(self, level: int, policy, max_iterations: int = 60) -> dict:
+        runner = Runner(model="local:test", puzzle_level=level, client=LocalClient(policy))
+        return runner.run_eval(max_iterations=max_iterations)
+
+    def test_carrying_a_button_does_not_beat_the_solver(self):
+        result = self.run_episode(1, ScriptedPolicy(CARRY_BUTTON, repeat=False), max_iterations=len(CARRY_BUTTON))
+        self.assertFalse(result['is_solved'])
+
+    def test_efficiency_is_at_most_one(self):
+        episodes = [(1, OraclePolicy()), (2, OraclePolicy()), (GeneratedLevel(CROSSING), OraclePolicy()),
+                    (GeneratedLevel(CROSSING), ScriptedPolicy(CROSSING_ROUTE, repeat=False))]
+        for level, policy in episodes:
+            result = self.run_episode(level, policy)
+            self.assertTrue(result['is_solved'])
+            self.assertLessEqual(result['efficiency'], 1.0, (level, result['total_steps'], result['optimal_steps']))
+        self.assertEqual(solve(GeneratedLevel(CROSSING).puzzle).steps, 8)
+
+    def test_solver_matches_brute_force(self):
+        rng = random.Random(0)
+        for seed in range(40):
+            grid_size = rng.choice([(1, 7), (3, 3), (4, 3), (4, 4)])
+            spec = random_spec(rng, seed, grid_size, rng.randint(1, 2), rng.randint(1, 2), rng.randint(0, 2), 0.5)
+            puzzle = GeneratedLevel(spec).puzzle
+            solution = solve(puzzle)
+            self.assertEqual(solution.steps if solution else None, brute_force(puzzle), spec)
+
+    def test_only_carryable_objects_are_picked_up(self):
+        puzzle = levels.get_level(1).puzzle
+        handler = ActionHandler(puzzle)
+        for action in ["move up", "move right", "pick_up button"]:
+            handler.execute(action)
+        self.assertIsNone(puzzle.player.inventory)
+        self.assertEqual(solve(levels.get_level(1).puzzle).steps, 6)
+
+    def test_batch_puzzle_refuses_the_same_objects(self):
+        puzzle = levels.get_level(1).puzzle
+        batch = BatchPuzzle(puzzle, 1)
+        handler = ActionHandler(puzzle)
+        for action in CARRY_BUTTON:
+            handler.execute(action)
+            batch.step(batch.encode_many([action]))
+            self.assertEqual(batch.snapshot(0), puzzle.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from types import SimpleNamespace
+
+from aisuite import Client
+from aisuite.framework import ChatCompletionResponse
+from aisuite.provider import Provider
+
+from link.puzzles.escaperoom.clients import keep_usage
+from link.puzzles.escaperoom.runner import Runner
+
+
+def anthropic_message(text: str, cache_read: int) -> SimpleNamespace:
+    # the fields of anthropic.types.Message that matter here
+    return SimpleNamespace(
+        id="msg_01", type="message", role="assistant", model="claude-3-5-sonnet-20240620", stop_reason="end_turn",
+        content=[SimpleNamespace(type="text", text=text)],
+        usage=SimpleNamespace(input_tokens=20, output_tokens=3, cache_creation_input_tokens=0 if cache_read else 500,
+                              cache_read_input_tokens=cache_read),
+    )
+
+
+class AnthropicLikeProvider(Provider):
+    # aisuite's AnthropicProvider with the SDK call replaced: normalize_response keeps only the text
+    def __init__(self, action: str):
+        self.action = action
+        self.requests = []
+
+    def chat_completions_create(self, model, messages, **kwargs):
+        self.requests.append(messages)
+        cache_read = 500 if len(self.requests) > 1 else 0
+        return self.normalize_response(anthropic_message(self.action, cache_read))
+
+    def normalize_response(self, response):
+        normalized_response = ChatCompletionResponse()
+        normalized_response.choices[0].message.content = response.content[0].text
+        return normalized_response
+
+
+class AnthropicUsageTest(unittest.TestCase):
+    def make_client(self, provider: Provider) -> Client:
+        client = Client()
+        client.providers["anthropic"] = provider
+        return client
+
+    def test_normalized_responses_have_no_usage(self):
+        client = self.make_client(AnthropicLikeProvider("move up"))
+        response = client.chat.completions.create(model="anthropic:claude", messages=[{"role": "user", "content": "hi"}])
+        self.assertFalse(hasattr(response, "usage"))
+
+    def test_cached_tokens_are_reported(self):
+        provider = AnthropicLikeProvider("move up")
+        client = keep_usage(self.make_client(provider))
+        runner = Runner(model="anthropic:claude-3-5-sonnet-20240620", puzzle_level=1, client=client, prompt_cache=["anthropic"])
+        results = runner.run_eval(max_iterations=3)
+
+        self.assertIn("cache_control", provider.requests[0][0]["content"][0])
+        turns = results["turns"]
+        self.assertEqual(len(turns), len(provider.requests))
+        self.assertEqual([turn["cached_input_tokens"] for turn in turns], [0] + [500] * (len(turns) - 1))
+        # cache reads and writes count as input
+        self.assertEqual({turn["input_tokens"] for turn in turns}, {520})
+        self.assertEqual(results["total_cached_input_tokens"], 500 * (len(turns) - 1))
+        self.assertAlmostEqual(results["prompt_cache_hit_rate"], 500 * (len(turns) - 1) / (520 * len(turns)))
+
+
+if __name__ == '__main__':
+    unittest.main()